@@ -0,0 +1,96 @@
+import contextlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+
+class AdaptivePoller:
+    """
+    Interval policy for a polling loop: fast right after activity, exponential backoff while idle
+    and no polling at all while the gate is closed (e.g. during a page reload).
+
+    Call activity() or idle() after each poll, then sleep() before the next one. Loops that block on
+    an event instead of sleeping use delay() as the wait timeout and call idle() on an empty wakeup.
+
+    :param gate: threading.Event that is set while polling is allowed, shared between pollers
+    """
+
+    def __init__(self, name, min_interval, max_interval, backoff=2.0, gate=None):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.gate = gate
+        self.interval = min_interval
+        self.polls = 0
+        self.activities = 0
+        self.paused_time = 0
+        self.skipped = 0
+
+    def activity(self):
+        self.activities += 1
+        self.interval = self.min_interval
+
+    def idle(self):
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def delay(self):
+        """
+        Count a poll and return how long to wait before it.
+        """
+        self.polls += 1
+        # Every min_interval past the first is a poll a fixed interval would have done here
+        self.skipped += self.interval / self.min_interval - 1
+        return self.interval
+
+    def wait_for_gate(self):
+        if self.gate is None or self.gate.is_set():
+            return
+        start_time = time.time()
+        self.gate.wait()
+        paused = time.time() - start_time
+        self.paused_time += paused
+        self.skipped += paused / self.min_interval
+        # Whatever happened during the pause, look again soon
+        self.interval = self.min_interval
+
+    def sleep(self):
+        time.sleep(self.delay())
+        self.wait_for_gate()
+
+    @property
+    def gate_open(self):
+        return self.gate is None or self.gate.is_set()
+
+    @property
+    def avoided_polls(self):
+        """
+        Polls saved compared to polling at min_interval, counted from the waits that were actually
+        longer than that and from the time spent behind a closed gate.
+        """
+        return int(self.skipped)
+
+    def log_stats(self):
+        logger.info(f'Poller {self.name}: {self.polls} polls, {self.avoided_polls} avoided, '
+                    f'{self.activities} with activity, paused {self.paused_time:.0f}s, '
+                    f'interval now {self.interval:.2f}s')
+
+
+@contextlib.contextmanager
+def closed_gate(gate):
+    """
+    Close the gate while the block runs.
+    """
+    gate.clear()
+    try:
+        yield
+    finally:
+        gate.set()
+
+
+def open_gate():
+    gate = threading.Event()
+    gate.set()
+    return gate
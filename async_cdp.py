@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+
+import websockets
+
+from command_stats import calling_function
+
+logger = logging.getLogger('my_application')
+
+
+class AsyncCDPSession:
+    """
+    asyncio DevTools protocol client, any number of commands can be in flight at once.
+    """
+
+    def __init__(self, ws_url, timeout=10, recorder=None):
+        self.ws_url = ws_url
+        self.timeout = timeout
+        self.recorder = recorder
+        self.ws = None
+        self.commands = 0
+        self.command_time = 0
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._callbacks = {}
+        self._receiver = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.ws_url, max_size=None, origin=None)
+        self._receiver = asyncio.ensure_future(self._receive_loop())
+
+    async def _receive_loop(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.pop(message['id'], None)
+                    if future and not future.done():
+                        future.set_result(message)
+                    continue
+
+                for callback in list(self._callbacks.get(message.get('method'), [])):
+                    try:
+                        callback(message.get('params', {}))
+                    except Exception as e:
+                        logger.error(f'DevTools callback for {message.get("method")} failed: {e}')
+        except Exception as e:
+            logger.error(f'DevTools connection lost: {e}')
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(Exception('DevTools session closed'))
+            self._pending.clear()
+
+    async def send(self, method, params=None, timeout=None):
+        message_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        caller = calling_function() if self.recorder is not None else None
+        start_time = time.perf_counter()
+        outcome = 'exception'
+        try:
+            await self.ws.send(json.dumps({'id': message_id, 'method': method, 'params': params or {}}))
+            response = await asyncio.wait_for(future, timeout or self.timeout)
+            outcome = 'error' if 'error' in response else 'success'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise Exception(f'DevTools command {method} timed out')
+        finally:
+            # Nothing will answer a command that failed to send or timed out
+            self._pending.pop(message_id, None)
+            latency = time.perf_counter() - start_time
+            self.commands += 1
+            self.command_time += latency
+            if self.recorder is not None:
+                self.recorder.record(method, caller, latency, outcome)
+
+        if 'error' in response:
+            raise Exception(f'DevTools command {method} failed: {response["error"].get("message")}')
+        return response.get('result', {})
+
+    async def evaluate(self, expression, await_promise=False):
+        result = await self.send('Runtime.evaluate', {'expression': expression, 'returnByValue': True,
+                                                      'awaitPromise': await_promise})
+        if 'exceptionDetails' in result:
+            raise Exception(f'Script failed: {result["exceptionDetails"].get("text")}')
+        return result['result'].get('value')
+
+    async def call(self, function_body, *args):
+        """
+        Run a WebDriver style script body, arguments are available as arguments[i].
+        """
+        return await self.evaluate(f'(function () {{\n{function_body}\n}}).apply(null, {json.dumps(args)})')
+
+    def on(self, event, callback):
+        self._callbacks.setdefault(event, []).append(callback)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
@@ -0,0 +1,264 @@
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from async_cdp import AsyncCDPSession
+from driver_executor import DUEL_RESPONSE, INCOMING_ACCEPT, OPPONENT_SEARCH
+from ui_watcher import check_script, install_script, watched_xpaths
+
+logger = logging.getLogger('my_application')
+
+coordinates_expression = """(function () {
+    if (window.__botWatcher) {
+        return [window.__botWatcher.state.x, window.__botWatcher.state.y];
+    }
+    var values = ['X:', 'Y:'].map(function (prefix) {
+        var element = document.evaluate("//span[contains(text(), '" + prefix + "')]", document, null,
+            XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        return element ? parseInt(element.textContent.slice(3)) : null;
+    });
+    return values;
+})()"""
+
+click_incoming_accept_script = """
+var button = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE,
+    null).singleNodeValue;
+if (!button) {
+    return false;
+}
+button.click();
+return true;
+"""
+
+remove_incoming_accept_script = """
+var button = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE,
+    null).singleNodeValue;
+if (button) {
+    button.remove();
+}
+"""
+
+
+class AsyncRuntime:
+    """
+    Runs the duel listeners and the opponent search as coroutines over a direct DevTools connection.
+
+    Page events come from the UI watcher through a Runtime binding, so nothing is polled. Commands
+    that touch the page still take a lease on the DriverExecutor at their priority, which keeps the
+    executor the single owner of the page while long flows like process_duel and reload_page run there.
+    A lease parks the executor thread, so a duel response waits for the lease it arrives behind; leases
+    only cover one batch of commands and lease_timeout caps a lease whose holder got stuck.
+
+    :param plan_search: callable(x, y, img, region) -> list of steps, run on a worker thread. A step is
+        ('click', x, y), ('sleep', seconds) or ('script', body, args), region is None for a full view
+        screenshot
+    :param capture_frame: callable() -> (img, region) run on a worker thread under the search lease, e.g.
+        the configured frame source. Without it a PNG screenshot is taken over the DevTools connection
+    :param respond_to_duel: executor task that handles a duel request
+    :param on_search_done: callable(error) called after every search iteration, error is None on success
+    :param search_poller: AdaptivePoller that sets the pause between search iterations instead of search_interval
+    """
+
+    def __init__(self, ws_url, executor, plan_search, respond_to_duel, on_search_done, click_script,
+                 lease_timeout=10, search_interval=0.35, recorder=None, search_poller=None, retry_delay=0.5,
+                 capture_frame=None):
+        self.ws_url = ws_url
+        self.executor = executor
+        self.plan_search = plan_search
+        self.respond_to_duel = respond_to_duel
+        self.on_search_done = on_search_done
+        self.click_script = click_script
+        self.lease_timeout = lease_timeout
+        self.search_interval = search_interval
+        self.recorder = recorder
+        self.search_poller = search_poller
+        self.retry_delay = retry_delay
+        self.capture_frame = capture_frame
+        self.session = None
+        self.loop = None
+        self.quiet_until = 0
+        self.search_iterations = 0
+        self._events = {}
+
+    def _event(self, name):
+        if name not in self._events:
+            self._events[name] = asyncio.Event()
+        return self._events[name]
+
+    def _on_binding(self, params):
+        if params.get('name') != '__botNotify':
+            return
+        event = json.loads(params['payload'])
+        self._event(event['type']).set()
+
+    def _on_load(self, params):
+        asyncio.ensure_future(self._install_watcher())
+
+    async def _install_watcher(self):
+        try:
+            await self.session.call(install_script, watched_xpaths)
+        except Exception as e:
+            logger.debug(f'Failed to install UI watcher: {e}')
+
+    async def _is_active(self, name):
+        return bool(await self.session.call(check_script, name))
+
+    @contextlib.asynccontextmanager
+    async def lease(self, priority, name):
+        """
+        Hold the page through the DriverExecutor while the block runs.
+
+        The executor can't preempt a lease, tasks of any priority wait until the block ends or
+        lease_timeout passes, so keep the block to the commands that need the page.
+        """
+        acquired = self.loop.create_future()
+        released = threading.Event()
+
+        def hold():
+            self.loop.call_soon_threadsafe(lambda: acquired.done() or acquired.set_result(None))
+            released.wait(self.lease_timeout)
+
+        self.executor.submit(priority, name, hold)
+        try:
+            await acquired
+            yield
+        finally:
+            released.set()
+
+    async def duel_request_loop(self):
+        event = self._event('duel_request')
+        while True:
+            await event.wait()
+            event.clear()
+            try:
+                await asyncio.wrap_future(self.executor.submit(DUEL_RESPONSE, 'process_duel', self.respond_to_duel))
+            except Exception as e:
+                logger.error(f'Exception caught in duel_request_loop: {e}')
+            # The request may still be open if processing failed, handle it again after a pause, the
+            # binding only fires when it shows up so this doesn't spin while it stays on the page
+            await asyncio.sleep(self.retry_delay)
+            if await self._is_active('duel_request'):
+                event.set()
+
+    async def incoming_accept_loop(self):
+        event = self._event('incoming_accept')
+        xpath = watched_xpaths['incoming_accept']
+        while True:
+            await event.wait()
+            event.clear()
+            try:
+                async with self.lease(INCOMING_ACCEPT, 'accept_incoming_request'):
+                    clicked = await self.session.call(click_incoming_accept_script, xpath)
+                if clicked:
+                    logger.debug('Incoming duel request accepted')
+                    # Keep the search from clicking away while the duel request screen opens
+                    self.quiet_until = time.time() + 3
+                    await asyncio.sleep(3)
+                    async with self.lease(INCOMING_ACCEPT, 'accept_incoming_request'):
+                        await self.session.call(remove_incoming_accept_script, xpath)
+            except Exception as e:
+                logger.debug(f'Failed to accept incoming request: {e}')
+            await asyncio.sleep(self.retry_delay)
+            if await self._is_active('incoming_accept'):
+                event.set()
+
+    async def capture(self):
+        """
+        :return: (img, region), region is None for a full view screenshot
+        """
+        if self.capture_frame is not None:
+            return await self.loop.run_in_executor(None, self.capture_frame)
+        # Lossless like the threaded runtime's screenshots, the detector's colour borders depend on it
+        result = await self.session.send('Page.captureScreenshot', {'format': 'png', 'optimizeForSpeed': True})
+        img_raw = base64.b64decode(result['data'])
+        img = await self.loop.run_in_executor(None, cv2.imdecode, np.frombuffer(img_raw, np.uint8), cv2.IMREAD_COLOR)
+        return img, None
+
+    async def run_steps(self, steps):
+        """
+        Run click and script steps, steps between two sleeps are pipelined under one lease.
+        """
+        group = []
+        for step in steps + [('sleep', 0)]:
+            if step[0] != 'sleep':
+                group.append(step)
+                continue
+            if group:
+                async with self.lease(OPPONENT_SEARCH, 'search_for_opponent'):
+                    await asyncio.gather(*[self._run_step(queued) for queued in group])
+                group = []
+            if step[1]:
+                await asyncio.sleep(step[1])
+
+    def _run_step(self, step):
+        if step[0] == 'click':
+            return self.session.call(self.click_script, step[1], step[2])
+        return self.session.call(step[1], *step[2])
+
+    async def search_once(self):
+        async with self.lease(OPPONENT_SEARCH, 'search_for_opponent'):
+            coordinates, (img, region) = await asyncio.gather(self.session.evaluate(coordinates_expression),
+                                                              self.capture())
+        if coordinates is None or None in coordinates:
+            raise Exception('Map coordinates not found')
+
+        steps = await self.loop.run_in_executor(None, self.plan_search, coordinates[0], coordinates[1], img, region)
+        await self.run_steps(steps)
+
+    async def search_loop(self):
+        while True:
+            wait_time = self.quiet_until - time.time()
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            error = None
+            try:
+                await self.search_once()
+            except Exception as e:
+                error = e
+            self.search_iterations += 1
+            self.on_search_done(error)
+            if self.search_poller is not None:
+                await asyncio.sleep(self.search_poller.delay())
+                # The lease alone would only queue the search behind a reload, wait until the page is back
+                if not self.search_poller.gate_open:
+                    await self.loop.run_in_executor(None, self.search_poller.wait_for_gate)
+            else:
+                await asyncio.sleep(self.search_interval)
+
+    async def stats_loop(self, interval=600):
+        while True:
+            await asyncio.sleep(interval)
+            commands = max(self.session.commands, 1)
+            logger.info(f'Async runtime: {self.session.commands} DevTools commands, '
+                        f'avg latency {self.session.command_time / commands * 1000:.1f}ms, '
+                        f'{self.search_iterations} search iterations')
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.session = AsyncCDPSession(self.ws_url, recorder=self.recorder)
+        await self.session.connect()
+        self.session.on('Runtime.bindingCalled', self._on_binding)
+        self.session.on('Page.loadEventFired', self._on_load)
+        await asyncio.gather(self.session.send('Runtime.enable'), self.session.send('Page.enable'),
+                             self.session.send('Runtime.addBinding', {'name': '__botNotify'}))
+        await self._install_watcher()
+
+        # Pick up anything that was already on the page before the binding existed
+        for name in ('duel_request', 'incoming_accept'):
+            if await self._is_active(name):
+                self._event(name).set()
+
+        await asyncio.gather(self.duel_request_loop(), self.incoming_accept_loop(), self.search_loop(),
+                             self.stats_loop())
+
+    def start(self):
+        thread = threading.Thread(target=asyncio.run, args=(self.main(),), daemon=True)
+        thread.start()
+        return thread
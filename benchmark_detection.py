@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from detection import OpponentDetector, detect_opponents, select_candidate, distance_degree_for_load, \
+    detection_area_bounds
+
+parser = argparse.ArgumentParser(description="Offline benchmark of the duel opponent detector")
+
+parser.add_argument("--frames-dir", type=str, required=True, help="Folder with recorded screenshots (png/jpg)")
+parser.add_argument("--labels", type=str, required=False,
+                    help="JSON file mapping frame file name to a list of [x, y] opponent centers")
+parser.add_argument("--server-load", type=int, default=5, required=False, help="Server load from 1 to 10")
+parser.add_argument("--repeat", type=int, default=5, required=False, help="How many times every frame is processed")
+parser.add_argument("--match-radius", type=float, default=15, required=False,
+                    help="Max distance in pixels between a candidate and a label to count as a hit")
+parser.add_argument("--detector", type=str, default="buffered", choices=["legacy", "buffered"], required=False,
+                    help="legacy runs the original RGB mask and contour pass, buffered runs OpponentDetector")
+
+frame_extensions = ('.png', '.jpg', '.jpeg')
+
+
+def load_frames(frames_dir):
+    frames = []
+    for name in sorted(os.listdir(frames_dir)):
+        if not name.lower().endswith(frame_extensions):
+            continue
+        with open(os.path.join(frames_dir, name), 'rb') as f:
+            frames.append((name, f.read()))
+    return frames
+
+
+def decode_frame_rgb(raw):
+    return cv2.cvtColor(cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+
+def decode_frame_bgr(raw):
+    return cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+
+
+class LegacyDetector:
+    def __init__(self, distance_from_center_degree):
+        self.distance_from_center_degree = distance_from_center_degree
+
+    def detect(self, img):
+        img_h, img_w, _ = img.shape
+        center_of_image = np.array((img_w // 2, img_h // 2))
+        min_detection_area, max_detection_area = detection_area_bounds(img_w, img_h)
+        return detect_opponents(img, center_of_image, self.distance_from_center_degree, min_detection_area,
+                                max_detection_area)
+
+
+def run_detection(detector, img):
+    valid_rects, x_cords, y_cords, distances_to_center = detector.detect(img)
+    select_candidate(x_cords, y_cords, distances_to_center)
+    return x_cords, y_cords
+
+
+def match_labels(x_cords, y_cords, labels, match_radius):
+    """
+    Greedily match candidates to labelled opponent centers.
+
+    :return: (true_positives, false_positives, false_negatives)
+    """
+    unmatched = [np.array(label, dtype=float) for label in labels]
+    true_positives = 0
+    for point in zip(x_cords, y_cords):
+        if not unmatched:
+            break
+        distances = [np.linalg.norm(label - point) for label in unmatched]
+        closest = int(np.argmin(distances))
+        if distances[closest] <= match_radius:
+            unmatched.pop(closest)
+            true_positives += 1
+    return true_positives, len(x_cords) - true_positives, len(unmatched)
+
+
+def format_percentiles(name, samples, unit, scale=1.0):
+    p50, p95, p99 = np.percentile(np.array(samples) * scale, [50, 95, 99])
+    return f'{name}: p50={p50:.3f}{unit} p95={p95:.3f}{unit} p99={p99:.3f}{unit}'
+
+
+def main():
+    args = parser.parse_args()
+    distance_from_center_degree = distance_degree_for_load(args.server_load)
+
+    frames = load_frames(args.frames_dir)
+    if not frames:
+        raise Exception(f'No frames found in {args.frames_dir}')
+
+    labels = None
+    if args.labels:
+        with open(args.labels, 'r') as f:
+            labels = json.load(f)
+
+    if args.detector == 'legacy':
+        decode_frame = decode_frame_rgb
+        detector = LegacyDetector(distance_from_center_degree)
+    else:
+        decode_frame = decode_frame_bgr
+        img_h, img_w, _ = decode_frame(frames[0][1]).shape
+        detector = OpponentDetector(img_w, img_h, distance_from_center_degree)
+
+    decoded = [(name, decode_frame(raw)) for name, raw in frames]
+    # Warm up OpenCV and numpy before measuring
+    run_detection(detector, decoded[0][1])
+
+    decode_times = []
+    detect_times = []
+    for _ in range(args.repeat):
+        for (_, raw), (_, img) in zip(frames, decoded):
+            start_time = time.perf_counter()
+            decode_frame(raw)
+            decode_times.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            run_detection(detector, img)
+            detect_times.append(time.perf_counter() - start_time)
+
+    # Allocations are measured in a separate pass, tracemalloc slows everything down
+    allocated_bytes = []
+    tracemalloc.start()
+    for _, img in decoded:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        run_detection(detector, img)
+        _, peak = tracemalloc.get_traced_memory()
+        allocated_bytes.append(peak - baseline)
+    tracemalloc.stop()
+
+    candidate_counts = []
+    true_positives = false_positives = false_negatives = 0
+    for name, img in decoded:
+        x_cords, y_cords = run_detection(detector, img)
+        candidate_counts.append(len(x_cords))
+        if labels is not None and name in labels:
+            tp, fp, fn = match_labels(x_cords, y_cords, labels[name], args.match_radius)
+            true_positives += tp
+            false_positives += fp
+            false_negatives += fn
+
+    img_h, img_w, _ = decoded[0][1].shape
+    print(f'Detector: {args.detector}, frames: {len(decoded)} ({img_w}x{img_h}), repeats: {args.repeat}, '
+          f'server load: {args.server_load}')
+    print(format_percentiles('Decode', decode_times, 'ms', 1000))
+    print(format_percentiles('Detect', detect_times, 'ms', 1000))
+    print(format_percentiles('Allocated per frame', allocated_bytes, 'KiB', 1 / 1024))
+    print(f'Candidates per frame: mean={np.mean(candidate_counts):.2f} '
+          f'min={np.min(candidate_counts)} max={np.max(candidate_counts)}')
+
+    if labels is not None:
+        precision = true_positives / max(true_positives + false_positives, 1)
+        recall = true_positives / max(true_positives + false_negatives, 1)
+        print(f'Ground truth: tp={true_positives} fp={false_positives} fn={false_negatives} '
+              f'precision={precision:.3f} recall={recall:.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import time
+
+from cdp import CDPSession, get_browser_ws_url, get_page_ws_url
+from frame_source import evaluate
+from render_budget import render_budget_expression
+
+# A bot started with --max-fps puts its own cap back every minute, benchmark one started without it
+parser = argparse.ArgumentParser(description="Chrome CPU use of a running bot instance at different frame rate caps")
+
+parser.add_argument("--debugger-address", type=str, required=True,
+                    help="host:port of the Chrome remote debugging endpoint of the instance")
+parser.add_argument("--target-id", type=str, default=None, required=False,
+                    help="Page target of the game tab, the first page target by default")
+parser.add_argument("--fps", type=str, default="0,30,20,15,10,5", required=False,
+                    help="Comma separated frame rate caps to measure, 0 for no cap")
+parser.add_argument("--duration", type=float, default=30, required=False, help="Seconds measured per setting")
+parser.add_argument("--warmup", type=float, default=5, required=False,
+                    help="Seconds to wait after changing the cap before measuring")
+
+
+def chrome_cpu_time(browser_session):
+    """
+    CPU seconds used by all processes of the Chrome instance, None when SystemInfo is not supported.
+    """
+    if browser_session is None:
+        return None
+    processes = browser_session.send('SystemInfo.getProcessInfo')['processInfo']
+    return sum(process['cpuTime'] for process in processes)
+
+
+def page_sample(page_session):
+    values = {metric['name']: metric['value']
+              for metric in page_session.send('Performance.getMetrics')['metrics']}
+    return values['TaskDuration'], values['Timestamp']
+
+
+def measure(page_session, browser_session, fps, warmup, duration):
+    evaluate(page_session, render_budget_expression(fps=fps))
+    time.sleep(warmup)
+
+    start_frames = evaluate(page_session, render_budget_expression())['frames']
+    start_task, start_timestamp = page_sample(page_session)
+    start_chrome = chrome_cpu_time(browser_session)
+    start_time = time.time()
+    time.sleep(duration)
+    end_frames = evaluate(page_session, render_budget_expression())['frames']
+    end_task, end_timestamp = page_sample(page_session)
+    end_chrome = chrome_cpu_time(browser_session)
+    elapsed = time.time() - start_time
+
+    return {
+        'fps': fps,
+        'frames_per_second': (end_frames - start_frames) / elapsed,
+        'main_thread': (end_task - start_task) / (end_timestamp - start_timestamp),
+        'chrome': (end_chrome - start_chrome) / elapsed if start_chrome is not None else None,
+    }
+
+
+def main():
+    args = parser.parse_args()
+    settings = [int(fps) for fps in args.fps.split(',')]
+
+    page_session = CDPSession(get_page_ws_url(args.debugger_address, args.target_id))
+    page_session.send('Performance.enable')
+    browser_session = CDPSession(get_browser_ws_url(args.debugger_address))
+    try:
+        chrome_cpu_time(browser_session)
+    except Exception as e:
+        print(f'SystemInfo.getProcessInfo is not available, only the main thread is measured: {e}')
+        browser_session.close()
+        browser_session = None
+
+    # Put the instance back to the cap it was running with
+    original_fps = evaluate(page_session, render_budget_expression())['fps']
+    try:
+        results = [measure(page_session, browser_session, fps, args.warmup, args.duration) for fps in settings]
+    finally:
+        evaluate(page_session, render_budget_expression(fps=original_fps))
+        page_session.close()
+        if browser_session is not None:
+            browser_session.close()
+
+    print(f'{"cap":>6} {"frames/s":>9} {"main thread":>12} {"chrome":>8}')
+    for result in results:
+        cap = result['fps'] or 'none'
+        chrome = f'{result["chrome"]:.0%}' if result['chrome'] is not None else 'n/a'
+        print(f'{cap:>6} {result["frames_per_second"]:>9.1f} {result["main_thread"]:>12.0%} {chrome:>8}')
+    print('CPU is the share of one core, chrome covers every process of the instance (renderer, GPU, browser)')
+
+
+if __name__ == '__main__':
+    main()
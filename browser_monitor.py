@@ -0,0 +1,172 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+megabyte = 1024 * 1024
+
+
+def growth_per_hour(samples, key):
+    """
+    Least squares slope of samples[key] over time, per hour.
+    """
+    if len(samples) < 2:
+        return 0
+    times = [sample['time'] for sample in samples]
+    values = [sample[key] for sample in samples]
+    mean_time = sum(times) / len(times)
+    mean_value = sum(values) / len(values)
+    variance = sum((t - mean_time) ** 2 for t in times)
+    if not variance:
+        return 0
+    covariance = sum((t - mean_time) * (v - mean_value) for t, v in zip(times, values))
+    return covariance / variance * 3600
+
+
+class BrowserMonitor:
+    """
+    Samples the tab's JS heap, DOM node count and CPU time with Performance.getMetrics and asks
+    for a reload only when they say the page has degraded.
+
+    A reload is requested when the heap or node count crosses its limit, when one of them keeps
+    growing faster than its growth limit (slope over the samples since the last reload, once there
+    are `min_growth_span` seconds of them), or when CPU use climbs over `max_cpu_growth` times what
+    it was right after the reload. `ceiling` keeps a blind reload for whatever the metrics miss.
+
+    Call reset() after every reload, the page starts over and so do the trends.
+
+    :param session_factory: callable() -> CDPSession attached to the game tab
+    :param on_reload: callable(reason)
+    :param ceiling: seconds between reloads at most, None to never reload blindly
+    """
+
+    def __init__(self, session_factory, on_reload, interval=60, ceiling=None, max_heap=1024 * megabyte,
+                 max_nodes=150000, max_heap_growth=200 * megabyte, max_node_growth=30000, max_cpu_growth=2.0,
+                 min_growth_span=1800, cpu_samples=5, history=240, request_timeout=600):
+        self.session_factory = session_factory
+        self.on_reload = on_reload
+        self.interval = interval
+        self.ceiling = ceiling
+        self.max_heap = max_heap
+        self.max_nodes = max_nodes
+        self.max_heap_growth = max_heap_growth
+        self.max_node_growth = max_node_growth
+        self.max_cpu_growth = max_cpu_growth
+        self.min_growth_span = min_growth_span
+        self.cpu_samples = cpu_samples
+        self.request_timeout = request_timeout
+        self.samples = collections.deque(maxlen=history)
+        self.session = None
+        self.last_reset = time.time()
+        self.requested = None
+        self.reloads = {}
+        self.failures = 0
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = self.session_factory()
+            self.session.send('Performance.enable')
+        return self.session
+
+    def sample(self):
+        """
+        Take a sample, cpu is the share of one core the renderer's main thread was busy since the
+        previous one.
+        """
+        result = self._get_session().send('Performance.getMetrics')
+        values = {metric['name']: metric['value'] for metric in result.get('metrics', [])}
+        sample = {'time': time.time(), 'heap': values.get('JSHeapUsedSize', 0), 'nodes': values.get('Nodes', 0),
+                  'cpu': None}
+        task_duration = values.get('TaskDuration')
+        timestamp = values.get('Timestamp')
+        with self._lock:
+            if self._previous is not None and task_duration is not None and timestamp is not None:
+                elapsed = timestamp - self._previous[1]
+                # TaskDuration starts over with the renderer, e.g. after a crash
+                if elapsed > 0 and task_duration >= self._previous[0]:
+                    sample['cpu'] = (task_duration - self._previous[0]) / elapsed
+            self._previous = (task_duration, timestamp)
+            self.samples.append(sample)
+        return sample
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.last_reset = time.time()
+            self.requested = None
+
+    def trends(self):
+        with self._lock:
+            samples = list(self.samples)
+        cpu = [sample['cpu'] for sample in samples if sample['cpu'] is not None]
+        return {
+            'heap': samples[-1]['heap'] if samples else 0,
+            'nodes': samples[-1]['nodes'] if samples else 0,
+            'span': samples[-1]['time'] - samples[0]['time'] if samples else 0,
+            'heap_growth': growth_per_hour(samples, 'heap'),
+            'node_growth': growth_per_hour(samples, 'nodes'),
+            'cpu_start': sum(cpu[:self.cpu_samples]) / len(cpu[:self.cpu_samples]) if cpu else None,
+            'cpu_now': sum(cpu[-self.cpu_samples:]) / len(cpu[-self.cpu_samples:]) if cpu else None,
+            'cpu_count': len(cpu),
+        }
+
+    def reload_reason(self, trends):
+        if self.ceiling is not None and time.time() - self.last_reset > self.ceiling:
+            return 'ceiling'
+        if trends['heap'] > self.max_heap:
+            return 'heap'
+        if trends['nodes'] > self.max_nodes:
+            return 'nodes'
+        if trends['span'] >= self.min_growth_span:
+            if trends['heap_growth'] > self.max_heap_growth:
+                return 'heap_growth'
+            if trends['node_growth'] > self.max_node_growth:
+                return 'node_growth'
+        if trends['cpu_count'] >= 2 * self.cpu_samples and trends['cpu_start'] and \
+                trends['cpu_now'] > trends['cpu_start'] * self.max_cpu_growth:
+            return 'cpu_growth'
+        return None
+
+    def check(self):
+        try:
+            self.sample()
+        except Exception as e:
+            self.failures += 1
+            self.session = None
+            logger.debug(f'Failed to sample browser metrics: {e}')
+        reason = self.reload_reason(self.trends())
+        # One request until the reload resets the monitor, the reload job may be queued behind others
+        # or skipped while another reload job runs, so ask again after request_timeout
+        if reason is None or (self.requested and time.time() - self.requested < self.request_timeout):
+            return
+        self.requested = time.time()
+        self.reloads[reason] = self.reloads.get(reason, 0) + 1
+        logger.info(f'Browser monitor requests a reload: {reason}')
+        try:
+            self.on_reload(reason)
+        except Exception as e:
+            self.requested = None
+            logger.error(f'Browser monitor reload for {reason} failed: {e}')
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def log_stats(self):
+        trends = self.trends()
+        cpu_now = f'{trends["cpu_now"]:.0%}' if trends['cpu_now'] is not None else 'n/a'
+        cpu_start = f'{trends["cpu_start"]:.0%}' if trends['cpu_start'] is not None else 'n/a'
+        logger.info(f'Browser: heap {trends["heap"] / megabyte:.0f} MB ({trends["heap_growth"] / megabyte:+.0f} MB/h), '
+                    f'{trends["nodes"]:.0f} DOM nodes ({trends["node_growth"]:+.0f}/h), cpu {cpu_now} '
+                    f'(after reload {cpu_start}), {time.time() - self.last_reset:.0f}s since reload')
+        logger.info(f'Browser monitor reloads: {self.reloads}, {self.failures} failed samples')
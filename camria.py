@@ -8,6 +8,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from seleniumbase import Driver
 import logging
+import logging.handlers
 import requests
 from functools import wraps
 import cv2
@@ -17,9 +18,35 @@ from time import sleep
 from selenium.webdriver.common.action_chains import ActionChains
 import random
 import argparse
+import atexit
+import json
+import os
 import schedule
 import threading
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from cdp import CDPSession, get_debugger_address, get_page_ws_url
+from frame_source import ScreencastFrameSource, CanvasFrameSource, CaptureRegion
+from detection import OpponentDetector, select_candidate, distance_degree_for_load, distances_to_point
+from engine_source import EngineOpponentSource
+from ui_watcher import UIWatcher
+from ui_state import bug_texts, get_ui_state
+from driver_executor import DriverExecutor, DUEL_RESPONSE, INCOMING_ACCEPT, OPPONENT_SEARCH, HOUSEKEEPING
+from interface_cleanup import install_interface_cleanup, outside_hidden
+from render_budget import boost_render_budget, install_render_budget
+from async_runtime import AsyncRuntime
+from command_stats import CommandStats, instrument_driver
+from metrics import Registry, RateWindow
+from log_shipper import LogShipper
+from telegram_notifier import TelegramNotifier
+from log_pipeline import RepeatFilter, setup_queue_logging
+from job_runner import JobRunner
+from adaptive_poller import AdaptivePoller, closed_gate, open_gate
+from page_wait import InPageWait
+from recovery import RecoveryLadder, RecoveryStep
+from throughput_watchdog import ThroughputWatchdog
+from browser_monitor import BrowserMonitor, megabyte
+from duel_lifecycle import (DuelLifecycle, PhaseTimeout, REQUESTED, ACCEPTED, ENTERING, FIGHTING, REWARD,
+                            IDLE)
 
 parser = argparse.ArgumentParser(description="Script Configuration")
 
@@ -36,7 +63,42 @@ parser.add_argument("--api-key", type=str, required=True, help="API key to rucap
 parser.add_argument("--tg-bot-token", type=str, required=True, help="Telegram bot token")
 parser.add_argument("--tg-chat-id", type=str, required=True, help="Telegram chat it")
 parser.add_argument("--tg-topic-id", type=str, required=True, help="Telegram topic id")
+parser.add_argument("--tg-api-base", type=str, default="https://api.telegram.org", required=False,
+                    help="Telegram Bot API url, e.g. a local server for testing")
 parser.add_argument("--server-load", type=int, default=5, required=False, help="Server load from 1 to 10")
+parser.add_argument("--record-frames", type=str, default=None, required=False,
+                    help="Folder to save every opponent search screenshot to, for benchmark_detection.py")
+parser.add_argument("--frame-source", type=str, default="screencast",
+                    choices=["screencast", "screenshot", "canvas-raw", "canvas-jpeg"], required=False,
+                    help="Where opponent search frames come from. Default is screencast.")
+parser.add_argument("--opponent-source", type=str, default="vision", choices=["vision", "engine"], required=False,
+                    help="Find opponents with the colour detector or from the game engine state. Default is vision.")
+parser.add_argument("--engine-actor-pattern", type=str, default="player", required=False,
+                    help="Regex matched against engine actor names to find players")
+parser.add_argument("--capture-clip", type=float, default=1.0, required=False,
+                    help="Part of the game canvas around the character to capture with canvas frame sources")
+parser.add_argument("--capture-quality", type=int, default=40, required=False,
+                    help="JPEG quality for the canvas-jpeg frame source")
+parser.add_argument("--metrics-port", type=int, default=None, required=False,
+                    help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics")
+parser.add_argument("--metrics-file", type=str, default=None, required=False,
+                    help="File to write Prometheus metrics to every 30 seconds")
+parser.add_argument("--runtime", type=str, default="threads", choices=["threads", "asyncio"], required=False,
+                    help="Run the duel listeners and opponent search as threads over WebDriver or as coroutines "
+                         "over DevTools. Default is threads.")
+parser.add_argument("--reload-ceiling", type=float, default=180, required=False,
+                    help="Minutes between page reloads at most, when browser metrics don't ask for one earlier. "
+                         "0 disables blind reloads. Default is 180.")
+parser.add_argument("--max-heap-mb", type=float, default=1024, required=False,
+                    help="Reload the page when its JS heap grows over this size. Default is 1024.")
+parser.add_argument("--max-dom-nodes", type=int, default=150000, required=False,
+                    help="Reload the page when it has more DOM nodes than this. Default is 150000.")
+parser.add_argument("--max-fps", type=int, default=0, required=False,
+                    help="Cap the game's animation loop to this many frames a second, 0 for no cap. Default is 0.")
+parser.add_argument("--capture-fps", type=int, default=30, required=False,
+                    help="Frame rate the cap is raised to while an opponent search frame is captured")
+parser.add_argument("--capture-boost", type=float, default=1.0, required=False,
+                    help="Seconds the cap stays raised after a capture starts")
 
 # Set defaults for the boolean arguments
 parser.set_defaults(save_image=False, debug=False, console_mode=False, passive=False, server_load=5)
@@ -46,13 +108,22 @@ args = parser.parse_args()
 SAVE_IMAGE = args.save_image
 DEBUG = args.debug
 CONSOLE_MODE = args.console_mode
+RECORD_FRAMES_DIR = args.record_frames
+FRAME_SOURCE = args.frame_source
+MAX_FPS = args.max_fps
+# Boosting only helps when it raises the cap
+boost_captures = MAX_FPS > 0 and (args.capture_fps == 0 or args.capture_fps > MAX_FPS)
+render_boost_until = 0
+if RECORD_FRAMES_DIR:
+    os.makedirs(RECORD_FRAMES_DIR, exist_ok=True)
 api_key = args.api_key
 tg_bot_token = args.tg_bot_token
 tg_chat_id = args.tg_chat_id
 tg_topic_id = args.tg_topic_id
+telegram_notifier = TelegramNotifier(tg_bot_token, tg_chat_id, api_base=args.tg_api_base).start()
 server_load = args.server_load
 click_around_chance = server_load * 0.1
-distance_from_center_degree = np.linspace(1, 3.25, 10)[server_load - 1]
+distance_from_center_degree = distance_degree_for_load(server_load)
 
 user_agent = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 '
               'Safari/537.36')
@@ -67,12 +138,14 @@ blast_networks = {
     'block_explorer': 'https://blastscan.io'
 }
 log_filename = 'log.txt'
+log_shipper = None
 log_format = '%(asctime)s: %(message)s'
 logger = logging.getLogger('my_application')
 logger.setLevel(logging.DEBUG)  # Set the logging level
 
-# Create a file handler for writing logs to a file
-file_handler = logging.FileHandler(log_filename)
+# Create a file handler for writing logs to a file, log_shipper follows it across rotations
+file_handler = logging.handlers.RotatingFileHandler(log_filename, maxBytes=5 * 1024 * 1024, backupCount=3,
+                                                    encoding='utf-8')
 file_handler.setLevel(logging.DEBUG)  # Set the logging level for the file handler
 file_handler.setFormatter(logging.Formatter(log_format))
 
@@ -81,63 +154,97 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.DEBUG)  # Set the logging level for the console handler
 console_handler.setFormatter(logging.Formatter(log_format))
 
-# Add the handlers to the logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# Write logs from a background thread so the driver executor never waits on disk or console I/O,
+# and rate limit the debug messages repeated on every search iteration
+log_repeat_filter = RepeatFilter(window=60, burst=5)
+log_listener = setup_queue_logging(logger, [file_handler, console_handler], filters=[log_repeat_filter])
+atexit.register(log_listener.stop)
+
+metrics = Registry()
+duels_metric = metrics.counter('bot_duels_total', 'Duels finished with a reward popup')
+duels_per_hour_metric = metrics.gauge('bot_duels_per_hour', 'Duels finished in the last hour')
+search_iterations_metric = metrics.counter('bot_search_iterations_total', 'Opponent search iterations', ['result'])
+search_exceptions_metric = metrics.gauge('bot_search_exceptions', 'Opponent search exceptions in a row')
+reloads_metric = metrics.counter('bot_reloads_total', 'Page reloads by reason', ['reason'])
+reload_duration_metric = metrics.histogram('bot_reload_duration_seconds', 'Time to reload the page and enter the world',
+                                           buckets=(5, 10, 20, 30, 60, 120, 300))
+detection_duration_metric = metrics.histogram('bot_detection_duration_seconds', 'Colour-mask detector run time')
+detection_candidates_metric = metrics.histogram('bot_detection_candidates', 'Opponent candidates per detector run',
+                                                buckets=(0, 1, 2, 3, 5, 8, 13, 21))
+executor_tasks_metric = metrics.counter('bot_executor_tasks_total', 'Finished driver executor tasks',
+                                        ['task', 'priority', 'result'])
+executor_wait_metric = metrics.counter('bot_executor_wait_seconds_total',
+                                       'Time tasks waited for the driver executor', ['task', 'priority'])
+executor_run_metric = metrics.counter('bot_executor_run_seconds_total', 'Time tasks held the driver executor',
+                                      ['task', 'priority'])
+executor_backlog_metric = metrics.gauge('bot_executor_backlog', 'Tasks queued or paused on the driver executor')
+jobs_metric = metrics.counter('bot_jobs_total', 'Scheduled job runs', ['job', 'result'])
+job_duration_metric = metrics.counter('bot_job_duration_seconds_total', 'Time spent running scheduled jobs', ['job'])
+polls_metric = metrics.counter('bot_polls_total', 'Polls done by each adaptive poller', ['poller'])
+avoided_polls_metric = metrics.gauge('bot_avoided_polls', 'Polls saved compared to a fixed interval', ['poller'])
+job_backlog_metric = metrics.gauge('bot_job_backlog', 'Scheduled jobs waiting for a worker', ['lane'])
+commands_metric = metrics.counter('bot_driver_commands_total', 'WebDriver and DevTools commands by outcome',
+                                  ['outcome'])
+duel_phase_metric = metrics.histogram('bot_duel_phase_seconds', 'Time spent in each duel phase', ['phase'],
+                                      buckets=(0.5, 1, 2, 4, 8, 16, 30, 60, 120))
+duel_outcomes_metric = metrics.counter('bot_duel_outcomes_total', 'How duels ended', ['outcome'])
+duel_times = RateWindow(3600)
+recoveries_metric = metrics.counter('bot_recoveries_total', 'Recoveries by reason and the step that fixed the page',
+                                    ['reason', 'step'])
+chat_discarded_metric = metrics.gauge('bot_chat_messages_discarded', 'Chat messages pruned in the page since it loaded')
+browser_heap_metric = metrics.gauge('bot_browser_heap_bytes', 'JS heap used by the game tab')
+browser_nodes_metric = metrics.gauge('bot_browser_dom_nodes', 'DOM nodes in the game tab')
+browser_cpu_metric = metrics.gauge('bot_browser_cpu_ratio', 'Share of a core the game tab main thread is busy')
+recovery_duration_metric = metrics.histogram('bot_recovery_seconds', 'Time to recover by the step that fixed the page',
+                                             ['step'], buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300))
 
 scheduler_logger = logging.getLogger('schedule')
 scheduler_logger.setLevel(logging.WARNING)
 
 
-def send_log_updates(token, chat_id, topic_id):
+def send_log_updates(topic_id):
+    global log_shipper
     try:
         # global last_duels, duels
 
         # if last_duels == duels:
-        #     send_telegram_message_to_topic(token, chat_id, f'Bot {tg_topic_id} is stuck')
+        #     send_telegram_message_to_topic(f'Bot {tg_topic_id} is stuck')
 
         # last_duels = duels
 
-        with open(log_filename, 'r') as log_file:
-            log_content = log_file.read()
-            send_telegram_message_to_topic(token, chat_id, log_content, topic_id)
+        if log_shipper is None:
+            def send(text):
+                try:
+                    return send_telegram_message_to_topic(text, topic_id).result(timeout=120)
+                except Exception as e:
+                    print(f'Error sending logs: {e}')
+                    return False
 
-        with open(log_filename, 'w'):
-            pass
+            log_shipper = LogShipper(log_filename, send)
+        log_shipper.ship()
     except Exception as e:
         print(f'Error sending logs: {e}')
 
 
-def refresh_if_no_duels(driver):
-    global last_duels, duels, duels_search_exceptions, distance_to_arena_same_count
-    if last_duels == duels:
-        with page_refresh_lock:
-            logger.debug('No duels found recently, refreshing page')
-            reload_page(driver)
-            duels_search_exceptions = 0
-            distance_to_arena_same_count = 0
-
-    last_duels = duels
+def recover_stalled(driver, reason):
+    """
+    Watchdog stall handler, throughput fell off its baseline.
+    """
+    global duels_search_exceptions, distance_to_arena_same_count
+    recovery_ladder.recover(driver, reason)
+    duels_search_exceptions = 0
+    distance_to_arena_same_count = 0
 
 
 def refresh_if_bug(driver):
     global duels_search_exceptions, distance_to_arena_same_count
 
-    if duels_search_exceptions > 20:
-        with page_refresh_lock:
-            logger.debug('Too many exceptions while searching for duels, refreshing page')
-            reload_page(driver)
-            duels_search_exceptions = 0
-            distance_to_arena_same_count = 0
-            return
-
     if distance_to_arena_same_count > 20:
-        with page_refresh_lock:
-            logger.debug('Too many same distances to arena, refreshing page')
-            reload_page(driver)
-            duels_search_exceptions = 0
-            distance_to_arena_same_count = 0
-            return
+        logger.debug('Too many same distances to arena, recovering page')
+        recovery_ladder.recover(driver, 'stuck_distance')
+        duels_search_exceptions = 0
+        distance_to_arena_same_count = 0
+        return
 
     if reload_page_if_bugged(driver):
         duels_search_exceptions = 0
@@ -145,23 +252,15 @@ def refresh_if_bug(driver):
         return
 
 
-def send_stuck_alert(token, chat_id):
-    if last_duels == duels:
-        send_telegram_message_to_topic(token, chat_id, f'Bot {tg_topic_id} is stuck')
-
+def send_stuck_alert(message):
+    send_telegram_message_to_topic(f'Bot {tg_topic_id} is stuck: {message}')
 
-def send_telegram_message_to_topic(token, chat_id, message, topic_id=None):
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    data = {
-        "chat_id": chat_id,
-        "text": message
-    }
-
-    if topic_id:
-        data['message_thread_id'] = topic_id
 
-    response = requests.post(url, data=data)
-    return response.json()
+def send_telegram_message_to_topic(message, topic_id=None):
+    """
+    Queue a message for the background notifier, returns a Future resolving to True once it is delivered.
+    """
+    return telegram_notifier.notify(message, topic_id)
 
 
 def open_profile(profile_id, headless=0):
@@ -270,6 +369,7 @@ class MetaMaskAuto:
         self.wait_fast = WebDriverWait(self.driver, 2, 0.5)
         self.wait = WebDriverWait(self.driver, 20, 1)
         self.wait_slow = WebDriverWait(self.driver, 40, 1)
+        self.page_wait = InPageWait(self.driver, 20)
 
         # self.metamask_url = metamask_url
         sleep(5)
@@ -627,10 +727,9 @@ class MetaMaskAuto:
     def connect(self):
         """Connect wallet
         """
-        sleep(5)
-        # Next
-        self.wait.until(EC.element_to_be_clickable(
-            (By.CSS_SELECTOR, "button[data-testid='page-container-footer-next']"))).click()
+        # Next, the popup renders the button before it reacts to clicks
+        self.page_wait.clickable((By.CSS_SELECTOR, "button[data-testid='page-container-footer-next']"),
+                                 settle=0.5).click()
 
         # Confirm
         self.wait.until(EC.element_to_be_clickable(
@@ -674,33 +773,65 @@ class MetaMaskAuto:
         logger.info('Sign successfully')
 
 
+simulate_mouse_event_script = """
+var simulateMouseEvent = function(element, eventName, coordX, coordY) {
+  element.dispatchEvent(new MouseEvent(eventName, {
+    view: window,
+    bubbles: true,
+    cancelable: true,
+    clientX: coordX,
+    clientY: coordY,
+    button: 0
+  }));
+};
+var clickAt = function(coordX, coordY) {
+  var theButton = document.elementFromPoint(coordX, coordY);
+  if (theButton) {
+    simulateMouseEvent(theButton, "mousedown", coordX, coordY);
+    simulateMouseEvent(theButton, "mouseup", coordX, coordY);
+    simulateMouseEvent(theButton, "click", coordX, coordY);
+  }
+  return theButton;
+};
+"""
+
+click_script = simulate_mouse_event_script + """
+return clickAt(arguments[0], arguments[1]);
+"""
+
+# Runs (x, y, delay) steps in order, waiting delay seconds after each click, and reports how many clicks hit an element
+click_sequence_script = simulate_mouse_event_script + """
+var steps = arguments[0];
+var done = arguments[arguments.length - 1];
+var index = 0;
+var clicked = 0;
+var next = function() {
+  if (index >= steps.length) {
+    done(clicked);
+    return;
+  }
+  var step = steps[index++];
+  if (clickAt(step[0], step[1])) {
+    clicked++;
+  }
+  setTimeout(next, step[2] * 1000);
+};
+next();
+"""
+
+
 # @retry(attempts=2)
-def click_on_coordinates(driver, x, y, script_timeout=10):
-    oldvalue = driver.__dict__["caps"]["timeouts"]["script"]
-    try:
-        driver.set_script_timeout(script_timeout)
-
-        elementclicked = driver.execute_script(
-            rf"""var simulateMouseEvent = function(element, eventName, coordX, coordY) {{
-          element.dispatchEvent(new MouseEvent(eventName, {{
-            view: window,
-            bubbles: true,
-            cancelable: true,
-            clientX: coordX,
-            clientY: coordY,
-            button: 0
-          }}));
-        }};
-        var theButton = document.elementFromPoint({x}, {y});
-        coordX = {x},
-        coordY = {y};
-        simulateMouseEvent (theButton, "mousedown", coordX, coordY);
-        simulateMouseEvent (theButton, "mouseup", coordX, coordY);
-        simulateMouseEvent (theButton, "click", coordX, coordY);return theButton;"""
-        )
-    finally:
-        driver.set_script_timeout(oldvalue)
-    return elementclicked
+def click_on_coordinates(driver, x, y):
+    return driver.execute_script(click_script, x, y)
+
+
+def click_sequence(driver, steps):
+    """
+    Click a list of (x, y, delay) steps in a single browser call.
+
+    :return: number of clicks that hit an element
+    """
+    return driver.execute_async_script(click_sequence_script, [[x, y, delay] for x, y, delay in steps])
 
 
 def is_element_visible(driver, xpath):
@@ -721,7 +852,7 @@ def try_find_element(xpath, name, i=-1):
 
 def try_wait_for_element(xpath, name, wait_obj):
     try:
-        element = wait_obj.until(EC.element_to_be_clickable((By.XPATH, xpath)))
+        element = wait_obj.clickable((By.XPATH, xpath))
         return element
     except:
         raise Exception(f"Element {name} not found")
@@ -749,99 +880,162 @@ def time_tracker(func):
 
 
 def click_around_character(driver, x, y):
-    click_on_coordinates(driver, tab_center_x * 0.9, tab_center_y)
-    sleep(0.2)
-    click_on_coordinates(driver, tab_center_x * 1.1, tab_center_y)
-    sleep(0.2)
-    click_on_coordinates(driver, tab_center_x, tab_center_y * 1.1)
-    sleep(0.2)
-    click_on_coordinates(driver, tab_center_x, tab_center_y * 0.9)
+    click_sequence(driver, [(tab_center_x * 0.9, tab_center_y, 0.2),
+                            (tab_center_x * 1.1, tab_center_y, 0.2),
+                            (tab_center_x, tab_center_y * 1.1, 0.2),
+                            (tab_center_x, tab_center_y * 0.9, 0)])
 
 
 def click_around(driver):
     try:
-        click_on_coordinates(driver, *enemy_position_left)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_right)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_left2)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_right2)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_left3)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_right3)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_left4)
-        sleep(0.05)
-        click_on_coordinates(driver, *enemy_position_right4)
+        click_sequence(driver, [(*enemy_position_left, 0.05),
+                                (*enemy_position_right, 0.05),
+                                (*enemy_position_left2, 0.05),
+                                (*enemy_position_right2, 0.05),
+                                (*enemy_position_left3, 0.05),
+                                (*enemy_position_right3, 0.05),
+                                (*enemy_position_left4, 0.05),
+                                (*enemy_position_right4, 0)])
     except:
         pass
 
 
-def request_duel(driver):
-    logger.debug('Looking for duel opponent')
-    img = cv2.cvtColor(cv2.imdecode(np.frombuffer(driver.get_screenshot_as_png(), np.uint8), cv2.IMREAD_COLOR),
-                       cv2.COLOR_BGR2RGB)
+def full_view_region(img):
+    img_h, img_w = img.shape[:2]
+    return CaptureRegion(0, 0, tab_w / img_w, tab_h / img_h, img_w, img_h)
 
-    mask = np.all(img >= lower_pixel_border, axis=-1) & np.all(img <= upper_pixel_border, axis=-1)
-    img_dilation = cv2.dilate(mask.astype(np.uint8) * 255, detection_kernel, iterations=3)
-    contours, _ = cv2.findContours(img_dilation, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
-    bounding_rects = np.array([cv2.boundingRect(cnt) for cnt in contours])
-    areas = bounding_rects[:, 2] * bounding_rects[:, 3]
-    aspect_ratios = bounding_rects[:, 3] / np.maximum(bounding_rects[:, 2], 1)
+def capture_frame(driver):
+    """
+    Return (raw bytes, format, image, region) of the current game view.
 
-    # Filter based on area and aspect ratio
-    valid_filter = (min_detection_area < areas) & (areas < max_detection_area) & (aspect_ratios <= 1.8)
-    valid_rects = bounding_rects[valid_filter]
+    With a canvas frame source only the game canvas is captured. Otherwise reads the latest
+    screencast frame when available, waiting briefly for one newer than the last processed
+    frame, and falls back to a WebDriver screenshot.
+    """
+    global last_frame_seq, last_screencast_restart, render_boost_until
+    # A capped game renders rarely, let it draw a fresh frame for the capture. Only renewed when the
+    # boost is about to run out, so most captures don't pay a WebDriver call for it
+    if boost_captures and time.time() + frame_wait_timeout >= render_boost_until:
+        try:
+            boost_render_budget(driver, args.capture_fps, args.capture_boost)
+            render_boost_until = time.time() + args.capture_boost
+        except Exception as e:
+            logger.debug(f'Failed to boost the render budget: {e}')
+
+    if canvas_source is not None:
+        try:
+            captured = canvas_source.capture()
+            if captured is not None:
+                return captured
+        except Exception as e:
+            logger.debug(f'Canvas capture failed, falling back to screenshot: {e}')
+
+    if frame_source is not None and frame_source.started:
+        frame, img = frame_source.latest_image(newer_than=last_frame_seq, timeout=frame_wait_timeout,
+                                               max_age=frame_max_age)
+        if frame is not None:
+            last_frame_seq = frame.seq
+            return frame.data, frame.format, img, full_view_region(img)
+
+        if time.time() - last_screencast_restart > frame_max_age:
+            logger.debug('Screencast frames are stale, restarting screencast')
+            last_screencast_restart = time.time()
+            try:
+                frame_source.restart()
+            except Exception as e:
+                logger.error(f'Failed to restart screencast: {e}')
 
-    # Calculate contour centers
-    x_cords = valid_rects[:, 0] + valid_rects[:, 2] // 2
-    y_cords = valid_rects[:, 1] + valid_rects[:, 3] // 2
+    img_raw = driver.get_screenshot_as_png()
+    img = cv2.imdecode(np.frombuffer(img_raw, np.uint8), cv2.IMREAD_COLOR)
+    return img_raw, 'png', img, full_view_region(img)
 
-    # Calculate distances to the center of the image
-    distances_to_center = np.linalg.norm(center_of_image - np.stack((x_cords, y_cords), axis=1),
-                                         axis=1) ** distance_from_center_degree
 
-    if distances_to_center.size > 1:
-        if random.random() > 0.9:
-            selected_index = np.random.choice(distances_to_center.shape[0])
+def detect_opponent_on_frame(driver):
+    """
+    Find an opponent with the colour-mask detector.
+
+    :return: (x, y) in tab coordinates or None when there is nobody to pick
+    """
+    img_raw, img_format, img, region = capture_frame(driver)
+    if RECORD_FRAMES_DIR:
+        if img_format == 'raw':
+            cv2.imwrite(os.path.join(RECORD_FRAMES_DIR, f'{time.time():.3f}.png'),
+                        cv2.cvtColor(img, cv2.COLOR_RGBA2BGR))
         else:
-            min_dist_index = np.argmin(distances_to_center)
+            with open(os.path.join(RECORD_FRAMES_DIR, f'{time.time():.3f}.{img_format}'), 'wb') as f:
+                f.write(img_raw)
+
+    return pick_opponent(img, region)
 
-            # Exclude the point with the minimum distance from further calculations
-            distances_to_center = np.delete(distances_to_center, min_dist_index)
-            x_cords = np.delete(x_cords, min_dist_index)
-            y_cords = np.delete(y_cords, min_dist_index)
 
-            probabilities = 1 / (distances_to_center + 0.1)
-            probabilities /= probabilities.sum()
+def pick_opponent(img, region):
+    """
+    Run the colour-mask detector on a captured frame.
 
-            selected_index = np.random.choice(distances_to_center.shape[0], p=probabilities)
+    :return: (x, y) in tab coordinates or None when there is nobody to pick
+    """
+    with detection_duration_metric.time():
+        valid_rects, x_cords, y_cords, distances_to_center = opponent_detector.detect(img, (region.full_w,
+                                                                                            region.full_h))
+    detection_candidates_metric.observe(len(x_cords))
+    selected = select_candidate(x_cords, y_cords, distances_to_center)
+    if selected is None:
+        return None
+
+    # Extract coordinates of the selected contour
+    x_coordinate_screen, y_coordinate_screen = selected
+
+    # Visualize the selected contour
+    if SAVE_IMAGE:
+        img = img.copy()
+        for x0, y0, w, h in valid_rects.astype(int):
+            cv2.rectangle(img, (x0, y0), (x0 + w, y0 + h), (0, 255, 0), 2)
+        cv2.circle(img, (int(x_coordinate_screen), int(y_coordinate_screen)), 20, (255, 0, 0), -1)
+        cv2.imwrite('img_view.png', img)
+
+    # Convert frame coordinates to tab coordinates
+    return (region.offset_x + x_coordinate_screen * region.scale_x,
+            region.offset_y + y_coordinate_screen * region.scale_y)
+
+
+def detect_opponent_in_engine():
+    """
+    Find an opponent from the game engine actors.
 
-        # Extract coordinates of the selected contour
-        x_coordinate_screen, y_coordinate_screen = x_cords[selected_index], y_cords[selected_index]
+    :return: (found, (x, y) or None), found is False when the engine state is not available or no actor
+        matches --engine-actor-pattern
+    """
+    candidates = engine_source.candidates()
+    if candidates is None:
+        return False, None
 
-        # Convert screen coordinates to tab coordinates (adjust this formula if necessary)
-        x_coordinate = (x_coordinate_screen / img_w) * tab_w
-        y_coordinate = (y_coordinate_screen / img_h) * tab_h
+    x_cords, y_cords = candidates
+    distances_to_center = distances_to_point(x_cords, y_cords, np.array((tab_center_x, tab_center_y)),
+                                             distance_from_center_degree)
+    return True, select_candidate(x_cords, y_cords, distances_to_center)
 
-        # Visualize the selected contour
-        if SAVE_IMAGE:
-            for rect in zip(x_cords, y_cords, valid_rects[:, 2], valid_rects[:, 3]):
-                x0, y0, w, h = rect.astype(int)
-                cv2.rectangle(img, (x0, y0), (x0 + w, y0 + h), (0, 255, 0), 2)
-            cv2.circle(img, (int(x_coordinate_screen), int(y_coordinate_screen)), 20, (255, 0, 0), -1)
-            cv2.imwrite('img_view.png', img)
 
+def request_duel(driver):
+    """
+    Executor task, returns the tab coordinates to click.
+    """
+    logger.debug('Looking for duel opponent')
+    found = False
+    if engine_source is not None:
+        found, selected = detect_opponent_in_engine()
+    if not found:
+        selected = detect_opponent_on_frame(driver)
+
+    if selected is not None:
+        throughput_watchdog.record_detector_hit()
         # Perform the action based on selected coordinates
-        return x_coordinate, y_coordinate
+        return selected
     else:
         distance_to_arena, x_position_on_map, y_position_on_map = get_distance_to_arena(driver)
-        step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_map, step_size_from=80,
-                      step_size_to=250)
-        sleep(1.5)
+        yield from step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_map, step_size_from=80,
+                                 step_size_to=250)
+        yield 1.5
         return tab_center_x, tab_center_y
 
 
@@ -929,49 +1123,64 @@ def request_duel(driver):
 #         click_on_coordinates(driver, x_coordinate, y_coordinate)
 
 
-def close_secondary_popups(driver):
-    with page_refresh_lock:
-        with duel_request_lock:
-            try:
-                driver.find_element(By.XPATH, "//span[contains(text(), 'Leaderboard')]")
-                logger.debug('Leaderboard popup found, closing')
-                driver.find_element(By.XPATH, "//div[@class='close_button']").click()
-                return
-            except:
-                pass
+# Clickable elements, never inside a container the interface cleanup hides
+close_modal_xpath = outside_hidden("//img[@alt='Close modal']")
+close_button_xpath = outside_hidden("//div[@class='close_button']")
+back_to_character_xpath = outside_hidden("//button[contains(text(), 'Back To Character')]")
+duel_accept_xpath = outside_hidden("//div[contains(@class, 'pointer-events-auto')]//button[contains(text(), 'Accept')]")
+duel_decline_xpath = outside_hidden("//div[contains(@class, 'pointer-events-auto')]//button[contains(text(), 'Decline')]")
+profile_menu_close_xpath = outside_hidden("//div[contains(@class, 'profile-menu')]//button[contains(text(), 'X')]")
+chat_button_xpath = outside_hidden("//button[contains(text(), '💬')]")
+duel_request_xpath = outside_hidden("//span[contains(text(), 'Duel Request')]")
+duel_reward_xpath = outside_hidden("//span[contains(text(), 'Duel Reward')]")
+duel_history_xpath = outside_hidden("//span[contains(text(), 'Duel History')]")
+blast_orb_xpath = outside_hidden("//span[contains(text(), 'Blast Orb')]")
 
-            try:
-                driver.find_element(By.XPATH, "//span[contains(text(), 'Matchmaking Lobby')]")
-                logger.debug('Matchmaking Lobby popup found, closing')
-                driver.find_element(By.XPATH, "//img[@alt='Close modal']").click()
-                return
-            except:
-                pass
 
-            try:
-                driver.find_element(By.XPATH, "//button[contains(text(), 'Back To Character')]").click()
-                logger.debug('Back To Character found, closing')
-                return
-            except:
-                pass
+def close_secondary_popups(driver, state=None):
+    state = state or get_ui_state(driver)
+    try:
+        if state.leaderboard:
+            logger.debug('Leaderboard popup found, closing')
+            driver.find_element(By.XPATH, close_button_xpath).click()
+            return
+    except:
+        pass
 
-            try:
-                driver.find_element(By.XPATH, "//span[contains(text(), 'Something went wrong')]")
-                logger.debug('Something went wrong popup found, closing')
-                driver.find_element(By.XPATH, "//img[@alt='Close modal']").click()
-                return
-            except:
-                pass
+    try:
+        if state.matchmaking_lobby:
+            logger.debug('Matchmaking Lobby popup found, closing')
+            driver.find_element(By.XPATH, close_modal_xpath).click()
+            return
+    except:
+        pass
+
+    try:
+        if state.back_to_character:
+            driver.find_element(By.XPATH, back_to_character_xpath).click()
+            logger.debug('Back To Character found, closing')
+            return
+    except:
+        pass
+
+    try:
+        if state.something_went_wrong:
+            logger.debug('Something went wrong popup found, closing')
+            driver.find_element(By.XPATH, close_modal_xpath).click()
+            return
+    except:
+        pass
 
-        close_duel_end_popup(driver)
+    close_duel_end_popup(driver, state)
 
 
-def close_main_popups(driver):
+def close_main_popups(driver, state=None):
+    state = state or get_ui_state(driver)
     try:
-        driver.find_element(By.XPATH, "//span[contains(text(), 'Duel History')]")
-        logger.debug('Duel History popup found, closing')
-        driver.find_element(By.XPATH, "//img[@alt='Close modal']").click()
-        return
+        if state.duel_history:
+            logger.debug('Duel History popup found, closing')
+            driver.find_element(By.XPATH, close_modal_xpath).click()
+            return
     except:
         pass
 
@@ -981,8 +1190,7 @@ def decline_duel(driver, max_attempts=4):
     for attempt in range(max_attempts):
         # Click the decline button
         try:
-            decline_button = driver.find_element(By.XPATH,
-                                                 "//div[contains(@class, 'pointer-events-auto')]//button[contains(text(), 'Decline')]")
+            decline_button = driver.find_element(By.XPATH, duel_decline_xpath)
             decline_button.click()
 
             # Wait a short moment for the action to take effect
@@ -990,7 +1198,7 @@ def decline_duel(driver, max_attempts=4):
 
             # Check if the "Duel Request" text is still visible
             try:
-                driver.find_element(By.XPATH, "//span[contains(text(), 'Duel Request')]")
+                driver.find_element(By.XPATH, duel_request_xpath)
                 logger.debug('Duel Request is still visible, attempting to decline again')
             except:
                 logger.debug('Duel Request is no longer visible, duel declined successfully')
@@ -1001,48 +1209,87 @@ def decline_duel(driver, max_attempts=4):
     logger.error('Max attempts to decline duel reached, duel may not be declined properly')
 
 
-def process_duel():
-    logger.debug('Processing duel request')
-    accept_button = driver.find_element(By.XPATH,
-                                        "//div[contains(@class, 'pointer-events-auto')]//button[contains(text(), 'Accept')]")
+def duel_requested(timeout):
+    try:
+        accept_button = wait_fast.clickable((By.XPATH, duel_accept_xpath), timeout=timeout)
+    except TimeoutException:
+        raise PhaseTimeout('Accept button not found')
     accept_button.click()
     logger.debug('Duel accepted')
+    return ACCEPTED
 
+
+def duel_accepted(timeout):
     try:
-        wait_duel_start.until(EC.element_to_be_clickable((By.CLASS_NAME, "duel-entry-scene")))
+        wait_duel_start.clickable((By.CLASS_NAME, "duel-entry-scene"), timeout=timeout)
         logger.debug('Duel started')
-        sleep(8)
-        # Continue processing as the duel has started
+        return ENTERING
     except:
         logger.debug('Duel is not started yet, declining')
-        try:
-            decline_duel(driver)
-        except:
-            pass
-        sleep(2)
-        distance_to_arena, _, _ = get_distance_to_arena(driver)
-        if distance_to_arena > 900:
-            logger.debug('In duel after declining, processing duel')
-            sleep(6)
-        else:
-            logger.debug('Duel declined successfully, exiting function')
-            return  # Exit function as the duel is declined successfully
 
+    try:
+        decline_duel(driver)
+    except:
+        pass
+    # The decline can lose the race against the duel starting, give the entry scene a moment to
+    # show up and read the position from the page, the watcher's copy may be from before the teleport
+    try:
+        wait_fast.present((By.CLASS_NAME, "duel-entry-scene"), timeout=2)
+        logger.debug('Duel started while declining, processing duel')
+        return ENTERING
+    except TimeoutException:
+        pass
+    distance_to_arena, _, _ = get_distance_to_arena(driver, fresh=True)
+    if distance_to_arena > 900:
+        logger.debug('In duel after declining, processing duel')
+        return ENTERING
+    logger.debug('Duel declined successfully, exiting function')
+    return IDLE, 'declined'
+
+
+def duel_entering(timeout):
+    # The entry scene plays for a few seconds before the fight can be clicked
+    try:
+        wait_duel_start.gone((By.CLASS_NAME, "duel-entry-scene"), timeout=timeout)
+    except:
+        pass
+    return FIGHTING
+
+
+def duel_fighting(timeout):
     click_around(driver)
     sleep(2)
     click_around(driver)
 
-    # clean_up_interface_regular(driver)
-
     logger.debug('Waiting for duel to finish')
-    try_wait_for_element("//button[contains(text(), 'Close')]", "Close duel", wait_duel_close)
-    close_duel_end_popup(driver)
+    try:
+        wait_duel_close.clickable((By.XPATH, "//button[contains(text(), 'Close')]"), timeout=timeout)
+    except TimeoutException:
+        raise PhaseTimeout('Close duel not found')
+    return REWARD
 
+
+def duel_reward(timeout):
+    close_duel_end_popup(driver)
     clean_up_interface_regular(driver)
+    try:
+        wait_fast.gone((By.XPATH, duel_reward_xpath), timeout=timeout)
+    except TimeoutException:
+        raise PhaseTimeout('Duel reward popup still open')
+    return IDLE
+
+
+def process_duel():
+    logger.debug('Processing duel request')
+    # The search can't run while the duel holds the page
+    with throughput_watchdog.paused('duel'):
+        outcome = duel_lifecycle.run()
+    if outcome != 'finished':
+        logger.info(f'Duel ended early: {outcome}')
 
 
 def solve_capcha(driver):
-    wait_ultra_long.until(EC.element_to_be_clickable((By.XPATH, "//div[@id='recaptcha-v2' and @class='g-recaptcha']")))
+    wait_ultra_long.clickable((By.XPATH, "//div[@id='recaptcha-v2' and @class='g-recaptcha']"))
     EC.element_to_be_clickable((By.XPATH, "//div[@id='recaptcha-v2' and @class='g-recaptcha']"))
     recaptcha_v2_element = driver.find_element(By.XPATH, "//div[@id='recaptcha-v2' and @class='g-recaptcha']")
     sitekey = recaptcha_v2_element.get_attribute('data-sitekey')
@@ -1056,44 +1303,43 @@ def solve_capcha(driver):
     driver.execute_script(f"onRecaptchaSuccess(\"" + code + "\")")
 
 
-def is_captcha_required(driver):
-    if (is_element_visible(driver, "//p[contains(text(), 'Recaptcha verification failed')]") or
-            is_element_visible(driver, "//p[contains(text(), 'Server Disconnect')]") or
-            is_element_visible(driver,
-                               "//p[contains(text(), 'Are you a robot? Please complete the captcha to continue')]")):
-        return True
-    return False
+def is_captcha_required(driver, state=None):
+    return (state or get_ui_state(driver)).needs_captcha
 
 
-def solve_captcha_if_required(driver):
-    if is_captcha_required(driver):
+def solve_captcha_if_required(driver, state=None):
+    if is_captcha_required(driver, state):
         logger.debug('Captcha required, solving')
-        wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Reconnect')]"))).click()
+        wait_long.clickable((By.XPATH, "//button[contains(text(), 'Reconnect')]")).click()
         sleep(10)
         if is_captcha_required(driver):
             solve_capcha(driver)
             sleep(4)
-            wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Reconnect')]"))).click()
+            wait_long.clickable((By.XPATH, "//button[contains(text(), 'Reconnect')]")).click()
             sleep(10)
 
 
-def close_duel_end_popup(driver):
+def close_duel_end_popup(driver, state=None):
     global duels
     try:
-        driver.find_element(By.XPATH, "//span[contains(text(), 'Duel Reward')]")
+        if not (state or get_ui_state(driver)).duel_reward:
+            return
         duels += 1
+        duels_metric.inc()
+        duel_times.add()
+        throughput_watchdog.record_duel()
         logger.info(f'Duels: {duels}')
         try_wait_for_element("//button[contains(text(), 'Close')]", "Close duel end popup", wait).click()
-        sleep(4)
+        wait_fast.gone((By.XPATH, duel_reward_xpath), timeout=4)
     except:
         pass
 
 
-def display_chat(driver):
-    element = driver.find_element(By.XPATH, "//button[contains(text(), 'General')]")
-    if not element.is_displayed():
+def display_chat(driver, state=None):
+    state = state or get_ui_state(driver)
+    if state.chat_present and not state.chat_displayed:
         logger.debug('Chat not displayed, opening')
-        driver.find_element(By.XPATH, "//button[contains(text(), '💬')]").click()
+        driver.find_element(By.XPATH, chat_button_xpath).click()
 
 
 def clear_browser_cache():
@@ -1103,60 +1349,164 @@ def clear_browser_cache():
     })
 
 
+enter_world_xpath = "//button[contains(text(), 'Enter World')]"
+world_loaded_xpath = "//span[contains(text(), 'X:')]"
+
+
+def enter_world(driver, attempts=3):
+    """
+    Click Enter World until the click is taken. The button is clickable before the world has
+    loaded, so the click is repeated while the button stays on the page.
+    """
+    for attempt in range(attempts):
+        wait_long.clickable((By.XPATH, enter_world_xpath), settle=1.5).click()
+        try:
+            wait.gone((By.XPATH, enter_world_xpath))
+            return
+        except TimeoutException:
+            if is_captcha_required(driver):
+                # The captcha covers the button, the caller solves it
+                return
+            logger.debug(f'Enter World click #{attempt} was not taken, clicking again')
+    raise TimeoutException(f'Enter World still on the page after {attempts} clicks')
+
+
 @retry(5)
-def reload_page(driver):
-    driver.refresh()
-    logger.debug('Reloading page')
-    wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Enter World')]")))
-    sleep(10)
-    driver.find_element(By.XPATH, "//button[contains(text(), 'Enter World')]").click()
-    solve_captcha_if_required(driver)
-    try:
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'Blast Orb')]")))
-        driver.find_element(By.XPATH, "//img[@alt='Close modal']").click()
-    except:
-        pass
-    clean_up_interface(driver)
+def reload_page(driver, reason='scheduled'):
+    start_time = time.time()
+    # Listeners and the UI watcher stop polling until the game is back
+    with closed_gate(page_gate):
+        driver.refresh()
+        logger.debug('Reloading page')
+        enter_world(driver)
+        solve_captcha_if_required(driver)
+        # The map coordinates only show up once the world is loaded
+        wait_long.visible((By.XPATH, world_loaded_xpath))
+        try:
+            wait.clickable((By.XPATH, blast_orb_xpath))
+            driver.find_element(By.XPATH, close_modal_xpath).click()
+        except:
+            pass
+        clean_up_interface(driver)
+        apply_render_budget(driver)
+    browser_monitor.reset()
+    reloads_metric.labels(reason).inc()
+    reload_duration_metric.observe(time.time() - start_time)
     # close_duel_end_popup(driver)
 
 
-def reload_page_if_bugged(driver):
-    bug_texts = [
-        'walk with a duel request screen open, please click the decline button or refresh the game.',
-        'You are already in a duel request screen with someone else.'
-    ]
-
+def reload_page_if_bugged(driver, state=None):
     try:
-        for text in bug_texts:
-            if is_element_visible(driver, f"//span[contains(text(), '{text}')]"):
-                clear_chat(driver)
-                sleep(10)  # Wait for some time before rechecking
-                if is_element_visible(driver, f"//span[contains(text(), '{text}')]"):
-                    logger.debug('Page is bugged, reloading')
-                    with page_refresh_lock:
-                        reload_page(driver)
-                        return True
-                break  # Stop checking after finding the first visible bug text
+        if (state or get_ui_state(driver)).bug_text:
+            logger.debug('Page is bugged, recovering')
+            recovery_ladder.recover(driver, 'bug_text', first_step='clear_chat')
+            return True
         return False
     except:
         return False
 
 
-def get_distance_to_arena(driver):
-    x_position_on_map = int(driver.find_element(By.XPATH, "//span[contains(text(), 'X:')]").text[3:])
-    y_position_on_map = int(driver.find_element(By.XPATH, "//span[contains(text(), 'Y:')]").text[3:])
+blocking_popups = ['leaderboard', 'matchmaking_lobby', 'back_to_character', 'something_went_wrong', 'duel_history']
+
+
+def state_usable(state):
+    return (state.x is not None and state.y is not None and not state.bug_text and not state.needs_captcha
+            and not any(getattr(state, popup) for popup in blocking_popups))
+
+
+def page_usable(driver):
+    return state_usable(get_ui_state(driver))
+
+
+def character_can_move(driver):
+    """
+    Recovery check for a stuck character, takes a step and watches the map coordinates change.
+
+    Not read-only, every call clicks the map and walks the character one step towards the arena,
+    the same kind of step the opponent search takes.
+    """
+    state = get_ui_state(driver)
+    if not state_usable(state):
+        return False
+    click_on_coordinates(driver, *arena_step_target(state.x, state.y, step_size_from=80, step_size_to=250))
+    deadline = time.time() + 3
+    while time.time() < deadline:
+        time.sleep(0.5)
+        moved = get_ui_state(driver)
+        if (moved.x, moved.y) != (state.x, state.y):
+            return True
+    return False
+
+
+def bug_cleared(driver):
+    """
+    Recovery check for the chat bug text. Clearing the chat removes the text by itself, so the
+    character has to walk without the game posting it again.
+    """
+    return character_can_move(driver) and get_ui_state(driver).bug_text is None
+
+
+def recover_close_modal(driver, reason):
+    state = get_ui_state(driver)
+    close_secondary_popups(driver, state)
+    close_main_popups(driver, state)
+
+
+def recover_clear_chat(driver, reason):
+    clear_chat(driver)
+
+
+def recover_reconnect(driver, reason):
+    if is_captcha_required(driver):
+        solve_captcha_if_required(driver)
+        return
+    for button in driver.find_elements(By.XPATH, "//button[contains(text(), 'Reconnect')]"):
+        button.click()
+        wait.gone((By.XPATH, "//button[contains(text(), 'Reconnect')]"))
+        return
+
+
+# Re-enters the current route through the app router, the page and its loaded assets are kept
+soft_route_script = """
+window.history.pushState(window.history.state, '', window.location.pathname + window.location.search);
+window.dispatchEvent(new PopStateEvent('popstate', {state: window.history.state}));
+"""
+
+
+def recover_soft_route(driver, reason):
+    driver.execute_script(soft_route_script)
+    try:
+        wait_fast.clickable((By.XPATH, "//button[contains(text(), 'Enter World')]"), settle=1).click()
+    except TimeoutException:
+        pass
+    clean_up_interface(driver)
+
+
+def recover_full_reload(driver, reason):
+    reload_page(driver, reason)
+
+
+def get_distance_to_arena(driver, fresh=False):
+    """
+    :param fresh: read the position from the page instead of the UI watcher's last drain
+    """
+    coordinates = None if fresh else ui_watcher.coordinates()
+    if coordinates is None:
+        state = get_ui_state(driver)
+        if state.x is None or state.y is None:
+            raise Exception('Map coordinates not found')
+        coordinates = state.x, state.y
+    x_position_on_map, y_position_on_map = coordinates
     distance_to_arena = round(
         np.linalg.norm([x_position_on_map - arena_position_x, y_position_on_map - arena_position_y],
                        ord=2), 2)
     return distance_to_arena, x_position_on_map, y_position_on_map
 
 
-def step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_map, step_size_from=0, step_size_to=500):
-    logger.debug(f'Distance to arena: {distance_to_arena}, moving')
-
-    if random.random() > 0.9:
-        click_around(driver)
-
+def arena_step_target(x_position_on_map, y_position_on_map, step_size_from=0, step_size_to=500):
+    """
+    Tab coordinates of a random step towards the arena.
+    """
     def sign(x):
         return 1 if x > 0 else -1
 
@@ -1166,18 +1516,30 @@ def step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_ma
     x_step = random.randint(step_size_from, step_size_to) * x_sign
     y_step = random.randint(step_size_from, step_size_to) * y_sign
 
-    x_step_coord = tab_center_x + x_step
-    y_step_coord = tab_center_y + y_step
+    return tab_center_x + x_step, tab_center_y + y_step
+
+
+def step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_map, step_size_from=0, step_size_to=500):
+    """
+    Executor task, yields instead of sleeping while the character walks.
+    """
+    logger.debug(f'Distance to arena: {distance_to_arena}, moving')
+
+    if random.random() > 0.9:
+        click_around(driver)
+
+    x_step_coord, y_step_coord = arena_step_target(x_position_on_map, y_position_on_map, step_size_from,
+                                                   step_size_to)
 
     try:
         click_on_coordinates(driver, x_step_coord, y_step_coord)
     except Exception as e:
         pass
 
-    sleep(3)
+    yield 3
 
     try:
-        driver.find_element(By.XPATH, "//div[contains(@class, 'profile-menu')]//button[contains(text(), 'X')]").click()
+        driver.find_element(By.XPATH, profile_menu_close_xpath).click()
     except:
         pass
 
@@ -1274,72 +1636,36 @@ def remove_first_xpath_element(driver, xpath):
 
 def complete_tutorial():
     try:
-        wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Next')]"))).click()
+        wait_long.clickable((By.XPATH, "//button[contains(text(), 'Next')]")).click()
     except:
         logger.debug('Tutorial already completed')
         return
-    wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Next')]"))).click()
-    wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Next')]"))).click()
-    wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Got it!')]"))).click()
+    wait_long.clickable((By.XPATH, "//button[contains(text(), 'Next')]")).click()
+    wait_long.clickable((By.XPATH, "//button[contains(text(), 'Next')]")).click()
+    wait_long.clickable((By.XPATH, "//button[contains(text(), 'Got it!')]")).click()
 
 
 def clean_up_interface_regular(driver):
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'relative left')]")
-    remove_all_xpath_elements(driver, "//button[contains(@class, 'new-btn')]")
-    remove_first_xpath_element(driver, "//div[contains(@class, 'announcement-message-container')]")
-    clear_chat(driver)
+    # The chat is pruned by the interface cleanup observer as messages arrive
     action.scroll_by_amount(delta_y=-1000000, delta_x=0).perform()
 
 
-def clean_up_interface(driver):
-    remove_first_xpath_element(driver, "//div[contains(@class, 'minimap-subcontainer')]")
-    remove_first_xpath_element(driver, "//div[contains(@class, 'toolbar-buttons')]")
-    remove_first_xpath_element(driver, "//div[contains(@class, 'excalibur-container')]")
-    remove_first_xpath_element(driver, "//div[contains(@class, 'modifiers-container')]")
-    remove_first_xpath_element(driver, "//div[contains(@class, 'announcement-message-container')]")
-    remove_first_xpath_element(driver, "//div[contains(@class, 'navigation-bar')]")
-    remove_first_xpath_element(driver, "//section[@id='main-wip-disclaimer']")
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'confetti-holder')]")
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'scrolling-text')]")
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'relative left')]")
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'combat-ui-container')]")
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'tab-switcher-container')]")
-    remove_all_xpath_elements(driver, "//div[contains(@class, 'navigation-content')]")
-    remove_first_xpath_element(driver, "//section[contains(@class, 'message-form')]")
-    remove_all_xpath_elements(driver, "//button[contains(@class, 'new-btn')]")
-    remove_first_xpath_element(driver, "//div[@id='game']//div[contains(@style, 'display: block;')]")
-    remove_all_xpath_elements(driver, "//aside[@id='main-layout-left-aside']")
-
-    script = """
-    var xpath = "//aside[contains(@class, 'minimap-window')]";  // Example XPath, adjust as needed
-    var result = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+def apply_render_budget(driver):
+    global render_boost_until
+    if MAX_FPS:
+        # A reload drops the boost along with the cap
+        render_boost_until = 0
+        budget = install_render_budget(driver, MAX_FPS)
+        logger.debug(f'Render budget {budget["fps"]} fps, {budget["frames"]} frames since installed')
 
-    if (result) {
-        result.style.width = '0';
-        result.style.height = '0';
-    }
-    """
-
-    # Execute the script
-    driver.execute_script(script)
-
-    # Execute the script
-    driver.execute_script(script)
-
-    element = driver.find_element(By.CSS_SELECTOR, "aside.chat-window")
-    script = """
-    arguments[0].style.setProperty('left', '0px');
-    arguments[0].style.setProperty('bottom', '0px');
-    arguments[0].style.setProperty('width', '150px');
-    arguments[0].style.setProperty('height', '90px');
-    arguments[0].style.setProperty('min-width', '150px');
-    """
-    driver.execute_script(script, element)
 
+def clean_up_interface(driver):
+    install_interface_cleanup(driver, protected_texts=bug_texts)
+    remove_first_xpath_element(driver, "//div[@id='game']//div[contains(@style, 'display: block;')]")
     action.scroll_by_amount(delta_y=-1000000, delta_x=0).perform()
 
 
-send_telegram_message_to_topic(tg_bot_token, tg_chat_id, f'=========== Bot started ===========', tg_topic_id)
+send_telegram_message_to_topic(f'=========== Bot started ===========', tg_topic_id)
 
 driver = Driver(extension_zip='./MetaMask.zip',
                 headless2=CONSOLE_MODE,
@@ -1347,7 +1673,11 @@ driver = Driver(extension_zip='./MetaMask.zip',
                 chromium_arg='mute-audio,lang=en',
                 enable_3d_apis=True,
                 proxy=args.proxy)
+command_stats = CommandStats()
+instrument_driver(driver, command_stats)
 action = ActionChains(driver)
+# Covers the longest click sequence, set once instead of around every click
+driver.set_script_timeout(10)
 
 driver.maximize_window()
 driver.get('https://google.com')
@@ -1360,38 +1690,40 @@ metamask_auto = MetaMaskAuto(driver,
 
 metamask_auto.add_account(args.private_key)
 metamask_auto.add_network('Blast', 'https://rpc.blast.io', '81457', 'ETH', 'https://blastscan.io')
-wait_fast = WebDriverWait(driver, 3, 1)
-wait = WebDriverWait(driver, 20, 1)
-wait_long = WebDriverWait(driver, 60, 1)
-wait_ultra_long = WebDriverWait(driver, 180, 1)
-wait_tech_work_finish = WebDriverWait(driver, 180, 1)
-wait_duel_start = WebDriverWait(driver, 16, 1)
+# Waits resolve inside the page on the DOM change instead of polling once a second
+wait_fast = InPageWait(driver, 3)
+wait = InPageWait(driver, 20)
+wait_long = InPageWait(driver, 60)
+wait_ultra_long = InPageWait(driver, 180)
+wait_tech_work_finish = InPageWait(driver, 180)
+wait_duel_start = InPageWait(driver, 16)
 driver.switch_to.window(driver.window_handles[0])
 metamask_auto.driver.get('https://play.cambria.gg/')
-wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Connect Wallet')]"))).click()
-wait_fast.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'MetaMask')]"))).click()
+wait_long.clickable((By.XPATH, "//button[contains(text(), 'Connect Wallet')]")).click()
+wait_fast.clickable((By.XPATH, "//button[contains(., 'MetaMask')]")).click()
 logger.debug('Connecting wallet')
 metamask_auto.connect()
 metamask_auto.confirm()
 logger.debug('Connected wallet')
-wait_long.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[aria-disabled='false']"))).click()
+wait_long.clickable((By.CSS_SELECTOR, "button[aria-disabled='false']")).click()
 logger.debug('Clicked')
 metamask_auto.confirm()
-wait_long.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'Play')]"))).click()
-wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Connect Wallet')]"))).click()
-wait_fast.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'MetaMask')]"))).click()
+wait_long.clickable((By.XPATH, "//span[contains(text(), 'Play')]")).click()
+wait_long.clickable((By.XPATH, "//button[contains(text(), 'Connect Wallet')]")).click()
+wait_fast.clickable((By.XPATH, "//button[contains(., 'MetaMask')]")).click()
 metamask_auto.connect()
 try:
-    wait.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(text(), 'Play')]"))).click()
+    wait.clickable((By.XPATH, "//span[contains(text(), 'Play')]")).click()
 except:
     pass
-wait_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Enter World')]"))).click()
+wait_long.clickable((By.XPATH, "//button[contains(text(), 'Enter World')]")).click()
 try:
-    wait_ultra_long.until(EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Reconnect')]"))).click()
+    wait_ultra_long.clickable((By.XPATH, "//button[contains(text(), 'Reconnect')]")).click()
 except:
     pass
 solve_captcha_if_required(driver)
 complete_tutorial()
+apply_render_budget(driver)
 
 # def open_profile(profile_id):
 #     resp = requests.get(profile_open_endpoint, params={'serial_number': profile_id}).json()
@@ -1425,8 +1757,37 @@ complete_tutorial()
 # driver.maximize_window()
 # action = ActionChains(driver)
 
-wait_second_accept = WebDriverWait(driver, 10, 1)
-wait_duel_close = WebDriverWait(driver, 120, 3)
+wait_second_accept = InPageWait(driver, 10)
+
+
+def recovery_done(reason, step, duration):
+    recoveries_metric.labels(reason, step or 'none').inc()
+    if step is not None:
+        recovery_duration_metric.labels(step).observe(duration)
+
+
+recovery_ladder = RecoveryLadder([RecoveryStep('close_modal', recover_close_modal),
+                                  # Same as the old clear, wait 10s and look again before a reload
+                                  RecoveryStep('clear_chat', recover_clear_chat, settle=10),
+                                  RecoveryStep('reconnect', recover_reconnect, settle=5),
+                                  RecoveryStep('soft_route', recover_soft_route, settle=5),
+                                  RecoveryStep('full_reload', recover_full_reload)],
+                                 {'bug_text': bug_cleared,
+                                  'stuck_distance': character_can_move,
+                                  'duel_rate': character_can_move,
+                                  'search_rate': character_can_move,
+                                  'no_detector_hit': character_can_move},
+                                 page_usable, on_recovered=recovery_done)
+wait_duel_close = InPageWait(driver, 120)
+
+duel_lifecycle = DuelLifecycle({REQUESTED: duel_requested,
+                                ACCEPTED: duel_accepted,
+                                ENTERING: duel_entering,
+                                FIGHTING: duel_fighting,
+                                REWARD: duel_reward},
+                               {REQUESTED: 3, ACCEPTED: 16, ENTERING: 8, FIGHTING: 120, REWARD: 10},
+                               on_phase=lambda phase, duration, timed_out: duel_phase_metric.labels(phase).observe(duration),
+                               on_finish=lambda outcome, duration: duel_outcomes_metric.labels(outcome).inc())
 driver.set_window_size(500, 375)
 window_size = driver.get_window_size()
 tab_w = 2000
@@ -1444,11 +1805,31 @@ enemy_position_right3 = (round(tab_w // 2 + (tab_w * 0.04)), round(tab_h // 2 -
 enemy_position_left4 = (round(tab_w // 2 - (tab_w * 0.055)), round(tab_h // 2 - (tab_h * 0.04)))
 enemy_position_right4 = (round(tab_w // 2 + (tab_w * 0.055)), round(tab_h // 2 - (tab_h * 0.04)))
 
-img_raw = driver.get_screenshot_as_png()
-img_bytes = np.frombuffer(img_raw, np.uint8)
-img = cv2.cvtColor(cv2.imdecode(img_bytes, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
-img_h, img_w, _ = img.shape
-center_of_image = np.array((img_w // 2, img_h // 2))
+frame_source = None
+last_frame_seq = None
+last_screencast_restart = 0
+frame_wait_timeout = 0.5
+frame_max_age = 5
+if FRAME_SOURCE == 'screencast':
+    try:
+        frame_source = ScreencastFrameSource(CDPSession.from_driver(driver, recorder=command_stats))
+        frame_source.start()
+        last_screencast_restart = time.time()
+    except Exception as e:
+        logger.error(f'Failed to start screencast, falling back to screenshots: {e}')
+        frame_source = None
+
+canvas_source = None
+if FRAME_SOURCE in ('canvas-raw', 'canvas-jpeg'):
+    try:
+        canvas_source = CanvasFrameSource(CDPSession.from_driver(driver, recorder=command_stats),
+                                          mode=FRAME_SOURCE.split('-')[1], clip_ratio=args.capture_clip,
+                                          quality=args.capture_quality)
+    except Exception as e:
+        logger.error(f'Failed to set up canvas capture, falling back to screenshots: {e}')
+
+_, _, img, _ = capture_frame(driver)
+img_h, img_w = img.shape[:2]
 
 logger.info(f'Image size: {img_w}x{img_h}')
 logger.info(f'Tab size: {tab_w}x{tab_h}')
@@ -1463,112 +1844,286 @@ logger.info(f'Tab size: {tab_w}x{tab_h}')
 # interface_regions_relative = [[(int(img_w * x0), int(img_h * y0)), (int(img_w * x1), int(img_h * y1))] for
 #                               (x0, y0), (x1, y1) in interface_regions_absolute]
 
-min_area_percentage = 0.002
-max_area_percentage = 0.01
-min_detection_area = img_w * img_h * min_area_percentage
-max_detection_area = img_w * img_h * max_area_percentage
-detection_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (4, 6))
-lower_pixel_border = np.array([146, 134, 43])
-upper_pixel_border = np.array([235, 190, 90])
+opponent_detector = OpponentDetector(img_w, img_h, distance_from_center_degree)
+engine_source = None
+if args.opponent_source == 'engine':
+    engine_source = EngineOpponentSource(driver, args.engine_actor_pattern)
 
-global duels, last_duels, duels_search_exceptions, latest_distance_to_arena, distance_to_arena_same_count
+global duels, duels_search_exceptions, latest_distance_to_arena, distance_to_arena_same_count
 duels = 0
-last_duels = 0
 duels_search_exceptions = 0
 latest_distance_to_arena = 0
 distance_to_arena_same_count = 0
 
-send_telegram_message_to_topic(tg_bot_token, tg_chat_id, f'Setup finished', tg_topic_id)
+send_telegram_message_to_topic(f'Setup finished', tg_topic_id)
 logger.info('Setup done, starting duels abuse')
 arena_position_x = 7400
 arena_position_y = 5360
 
 clean_up_interface(driver)
 
-incoming_request_lock = threading.Lock()
-duel_request_lock = threading.Lock()
-page_refresh_lock = threading.Lock()
+# Open while the game is usable, reload_page closes it
+page_gate = open_gate()
+ui_watcher_poller = AdaptivePoller('ui_watcher', 0.1, 0.5, gate=page_gate)
+incoming_request_poller = AdaptivePoller('incoming_requests', 0.25, 1, gate=page_gate)
+duel_request_poller = AdaptivePoller('duel_requests', 0.1, 1, gate=page_gate)
+opponent_search_poller = AdaptivePoller('opponent_search', 0.35, 10, gate=page_gate)
+pollers = [ui_watcher_poller, incoming_request_poller, duel_request_poller, opponent_search_poller]
+
+ui_watcher = UIWatcher(driver, poller=ui_watcher_poller)
+ui_watcher.start()
+
+driver_executor = DriverExecutor()
+driver_executor.start()
+
+
+def accept_incoming_request():
+    incoming_duel_request = driver.find_element(By.XPATH,
+                                                "//div[contains(@class, 'chat-container')]//button[contains(text(), 'Accept')]")
+    logger.debug('Incoming duel request accepted')
+    incoming_duel_request.click()
+    yield 3
+    remove_first_xpath_element(driver, "//div[contains(@class, 'chat-container')]//button[contains(text(), 'Accept')]")
 
 
 def incoming_requests_listener():
     while True:
+        throughput_watchdog.heartbeat('incoming_requests_listener')
+        incoming_request_poller.wait_for_gate()
+        if not ui_watcher.wait_for('incoming_accept', timeout=incoming_request_poller.delay()):
+            incoming_request_poller.idle()
+            continue
         try:
-            incoming_duel_request = driver.find_element(By.XPATH,
-                                                        "//div[contains(@class, 'chat-container')]//button[contains(text(), 'Accept')]")
-            with page_refresh_lock:
-                with incoming_request_lock:
-                    logger.debug('Incoming duel request accepted')
-                    incoming_duel_request.click()
-                    sleep(3)
-                    remove_first_xpath_element(driver,
-                                               "//div[contains(@class, 'chat-container')]//button[contains(text(), 'Accept')]")
+            with throughput_watchdog.busy('incoming_requests_listener'):
+                driver_executor.run(INCOMING_ACCEPT, 'accept_incoming_request', accept_incoming_request)
         except:
             pass
-        finally:
-            time.sleep(0.25)
+        incoming_request_poller.activity()
+        incoming_request_poller.sleep()
+
+
+def respond_to_duel_request():
+    # The request may be gone by the time the task gets the driver, e.g. after a reload. Checked on
+    # the page, the drained state lags behind and the asyncio runtime would keep resubmitting
+    if not ui_watcher.is_active_now('duel_request'):
+        return
+    logger.debug('Duel request accepted')
+    process_duel()
 
 
 def duel_request_listener():
     while True:
+        throughput_watchdog.heartbeat('duel_request_listener')
+        duel_request_poller.wait_for_gate()
+        if not ui_watcher.wait_for('duel_request', timeout=duel_request_poller.delay()):
+            duel_request_poller.idle()
+            continue
         try:
-            driver.find_element(By.XPATH, "//span[contains(text(), 'Duel Request')]")
-            with page_refresh_lock:
-                with duel_request_lock:
-                    with incoming_request_lock:
-                        logger.debug('Duel request accepted')
-                        process_duel()
+            # A duel holds the listener for minutes, and it may queue behind a reload
+            with throughput_watchdog.busy('duel_request_listener'):
+                driver_executor.run(DUEL_RESPONSE, 'process_duel', respond_to_duel_request)
         except NoSuchElementException:
             pass
         except Exception as e:
             logger.error(f'Exception caught in duel_request_listener: {e}')
             pass
-        finally:
-            time.sleep(0.1)
+        duel_request_poller.activity()
+        duel_request_poller.sleep()
 
 
 def update_interface(driver):
     try:
-        solve_captcha_if_required(driver)
-        close_secondary_popups(driver)
+        state = get_ui_state(driver)
+        if state.suppressed_nodes is None:
+            logger.debug('Interface cleanup is missing, installing')
+            install_interface_cleanup(driver, protected_texts=bug_texts)
+        else:
+            logger.debug(f'Interface cleanup suppressed {state.suppressed_nodes} nodes, '
+                         f'discarded {state.chat_discarded} chat messages')
+            chat_discarded_metric.set(state.chat_discarded)
+        solve_captcha_if_required(driver, state)
+        close_secondary_popups(driver, state)
         clean_up_interface_regular(driver)
+        # Puts the cap back if the page was reloaded behind our back
+        apply_render_budget(driver)
     except Exception as e:
         logger.debug(f'Exception caught in update_interface: {e}')
         pass
 
 
+def search_for_opponent():
+    global distance_to_arena_same_count, latest_distance_to_arena
+    distance_to_arena, x_position_on_map, y_position_on_map = get_distance_to_arena(driver)
+    x_coordinate, y_coordinate = yield from request_duel(driver)
+    close_main_popups(driver)
+
+    if distance_to_arena == latest_distance_to_arena:
+        distance_to_arena_same_count += 1
+    else:
+        distance_to_arena_same_count = 0
+
+    latest_distance_to_arena = distance_to_arena
+
+    if distance_to_arena > 350:
+        yield from step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_map)
+        return
+    click_on_coordinates(driver, x_coordinate, y_coordinate)
+    yield 1.75
+    if random.random() > click_around_chance:
+        click_around_character(driver, x_coordinate, y_coordinate)
+
+
+# Script steps for the asyncio runtime, same as close_main_popups and the profile menu close in step_to_arena
+close_main_popups_script = """
+var find = function (xpath) {
+    return document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+};
+if (find(%s)) {
+    var close = find(%s);
+    if (close) {
+        close.click();
+    }
+}
+""" % (json.dumps(duel_history_xpath), json.dumps(close_modal_xpath))
+
+close_profile_menu_script = """
+var button = document.evaluate(%s, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (button) {
+    button.click();
+}
+""" % json.dumps(profile_menu_close_xpath)
+
+
+def plan_arena_step(x_position_on_map, y_position_on_map, step_size_from=0, step_size_to=500):
+    steps = []
+    if random.random() > 0.9:
+        steps += [('click', x, y) for x, y in (enemy_position_left, enemy_position_right, enemy_position_left2,
+                                               enemy_position_right2, enemy_position_left3, enemy_position_right3,
+                                               enemy_position_left4, enemy_position_right4)]
+    steps.append(('click', *arena_step_target(x_position_on_map, y_position_on_map, step_size_from, step_size_to)))
+    steps.append(('sleep', 3))
+    steps.append(('script', close_profile_menu_script, ()))
+    return steps
+
+
+def plan_search(x_position_on_map, y_position_on_map, img, region=None):
+    """
+    search_for_opponent for the asyncio runtime, returns the steps to run instead of running them.
+    """
+    global distance_to_arena_same_count, latest_distance_to_arena
+    distance_to_arena = round(
+        np.linalg.norm([x_position_on_map - arena_position_x, y_position_on_map - arena_position_y],
+                       ord=2), 2)
+
+    if distance_to_arena == latest_distance_to_arena:
+        distance_to_arena_same_count += 1
+    else:
+        distance_to_arena_same_count = 0
+    latest_distance_to_arena = distance_to_arena
+
+    if distance_to_arena > 350:
+        logger.debug(f'Distance to arena: {distance_to_arena}, moving')
+        return [('script', close_main_popups_script, ())] + plan_arena_step(x_position_on_map, y_position_on_map)
+
+    logger.debug('Looking for duel opponent')
+    steps = [('script', close_main_popups_script, ())]
+    found, selected = False, None
+    if engine_source is not None:
+        found, selected = driver_executor.run(OPPONENT_SEARCH, 'detect_opponent_in_engine', detect_opponent_in_engine)
+    if not found:
+        selected = pick_opponent(img, region or full_view_region(img))
+    if selected is None:
+        steps += plan_arena_step(x_position_on_map, y_position_on_map, step_size_from=80, step_size_to=250)
+        steps.append(('sleep', 1.5))
+        selected = tab_center_x, tab_center_y
+    else:
+        throughput_watchdog.record_detector_hit()
+
+    steps += [('click', *selected), ('sleep', 1.75)]
+    if random.random() > click_around_chance:
+        steps += [('click', tab_center_x * 0.9, tab_center_y), ('sleep', 0.2),
+                  ('click', tab_center_x * 1.1, tab_center_y), ('sleep', 0.2),
+                  ('click', tab_center_x, tab_center_y * 1.1), ('sleep', 0.2),
+                  ('click', tab_center_x, tab_center_y * 0.9)]
+    return steps
+
+
+def search_done(error):
+    global duels_search_exceptions
+    throughput_watchdog.heartbeat('opponent_search')
+    throughput_watchdog.record_iteration(error is None)
+    if error is None:
+        duels_search_exceptions = 0
+        search_iterations_metric.labels('success').inc()
+        opponent_search_poller.activity()
+    else:
+        duels_search_exceptions += 1
+        search_iterations_metric.labels('exception').inc()
+        opponent_search_poller.idle()
+        print(f'Exception caught in duel_opponent_search: {error}')
+
+
 def duel_opponent_search():
     while True:
         try:
             global duels_search_exceptions
-            with page_refresh_lock:
-                distance_to_arena, x_position_on_map, y_position_on_map = get_distance_to_arena(driver)
-                x_coordinate, y_coordinate = request_duel(driver)
-                with duel_request_lock:
-                    with incoming_request_lock:
-                        close_main_popups(driver)
-                        global distance_to_arena_same_count, latest_distance_to_arena
-
-                        if distance_to_arena == latest_distance_to_arena:
-                            distance_to_arena_same_count += 1
-                        else:
-                            distance_to_arena_same_count = 0
-
-                        latest_distance_to_arena = distance_to_arena
-
-                        if distance_to_arena > 350:
-                            step_to_arena(driver, distance_to_arena, x_position_on_map, y_position_on_map)
-                            continue
-                        click_on_coordinates(driver, x_coordinate, y_coordinate)
-                        sleep(1.75)
-                        if random.random() > click_around_chance:
-                            click_around_character(driver, x_coordinate, y_coordinate)
+            with throughput_watchdog.busy('opponent_search'):
+                driver_executor.run(OPPONENT_SEARCH, 'search_for_opponent', search_for_opponent)
             duels_search_exceptions = 0
+            search_iterations_metric.labels('success').inc()
+            throughput_watchdog.record_iteration(True)
+            opponent_search_poller.activity()
         except Exception as e:
             duels_search_exceptions += 1
+            throughput_watchdog.record_iteration(False)
+            search_iterations_metric.labels('exception').inc()
+            # Back off while the page is not in a searchable state
+            opponent_search_poller.idle()
             print(f'Exception caught in duel_opponent_search: {e}')
             pass
         finally:
-            time.sleep(0.35)
+            throughput_watchdog.heartbeat('opponent_search')
+            opponent_search_poller.sleep()
+
+
+def run_housekeeping(func, *args, **kwargs):
+    return driver_executor.run(HOUSEKEEPING, func.__name__, func, *args, **kwargs)
+
+
+@metrics.collector
+def collect_metrics():
+    duels_per_hour_metric.set(duel_times.count())
+    search_exceptions_metric.set(duels_search_exceptions)
+    executor_backlog_metric.set(driver_executor.backlog())
+    for name, stats in list(driver_executor.stats.items()):
+        executor_tasks_metric.labels(name, stats['priority'], 'success').set(stats['count'] - stats['failures'])
+        executor_tasks_metric.labels(name, stats['priority'], 'failure').set(stats['failures'])
+        executor_wait_metric.labels(name, stats['priority']).set(stats['wait_total'])
+        executor_run_metric.labels(name, stats['priority']).set(stats['run_total'])
+    for outcome, count in list(command_stats.totals.items()):
+        commands_metric.labels(outcome).set(count)
+    for name, stats in list(job_runner.stats.items()):
+        jobs_metric.labels(name, 'success').set(stats['runs'] - stats['failures'])
+        jobs_metric.labels(name, 'failure').set(stats['failures'])
+        jobs_metric.labels(name, 'skipped').set(stats['skipped'])
+        job_duration_metric.labels(name).set(stats['duration_total'])
+    for poller in pollers:
+        polls_metric.labels(poller.name).set(poller.polls)
+        avoided_polls_metric.labels(poller.name).set(poller.avoided_polls)
+    for lane, queued in job_runner.backlog().items():
+        job_backlog_metric.labels(lane).set(queued)
+    browser_trends = browser_monitor.trends()
+    browser_heap_metric.set(browser_trends['heap'])
+    browser_nodes_metric.set(browser_trends['nodes'])
+    if browser_trends['cpu_now'] is not None:
+        browser_cpu_metric.set(browser_trends['cpu_now'])
+
+
+def write_metrics_file():
+    try:
+        metrics.write(args.metrics_file)
+    except Exception as e:
+        logger.debug(f'Failed to write metrics file: {e}')
 
 
 def run_scheduler():
@@ -1577,21 +2132,54 @@ def run_scheduler():
         time.sleep(1)
 
 
-# todo: add reschedule of reload_page after some reload already done
-schedule.every(60).minutes.do(reload_page, driver=driver)
-schedule.every(2).minutes.do(refresh_if_bug, driver=driver)
-schedule.every(5).minutes.do(refresh_if_no_duels, driver=driver)
-schedule.every(1).minutes.do(update_interface, driver=driver)
-schedule.every(3).minutes.do(send_log_updates, token=tg_bot_token, chat_id=tg_chat_id, topic_id=tg_topic_id)
+# Browser jobs go through the driver executor, jobs that may reload the page never overlap
+job_runner = JobRunner({'browser': 1, 'io': 2}, wrappers={'browser': run_housekeeping})
+# Reloads come from the browser metrics, the ceiling replaces the old hourly reload
+browser_monitor = BrowserMonitor(
+    lambda: CDPSession.from_driver(driver, recorder=command_stats),
+    lambda reason: job_runner.submit('browser', 'monitor_reload', 'reload', reload_page, driver, reason),
+    ceiling=args.reload_ceiling * 60 or None, max_heap=args.max_heap_mb * megabyte, max_nodes=args.max_dom_nodes)
+browser_monitor.start()
+schedule.every(100).to(140).seconds.do(job_runner.job('browser', refresh_if_bug, group='reload'), driver=driver)
+schedule.every(50).to(70).seconds.do(job_runner.job('browser', update_interface), driver=driver)
+schedule.every(10).minutes.do(job_runner.job('io', driver_executor.log_stats, name='log_executor_stats'))
+schedule.every(10).minutes.do(job_runner.job('io', command_stats.log_summary))
+schedule.every(10).minutes.do(job_runner.job('io', job_runner.log_stats, name='log_job_stats'))
+schedule.every(10).minutes.do(job_runner.job('io', duel_lifecycle.log_stats, name='log_duel_stats'))
+schedule.every(10).minutes.do(job_runner.job('io', recovery_ladder.log_stats, name='log_recovery_stats'))
+schedule.every(10).minutes.do(job_runner.job('io', lambda: [poller.log_stats() for poller in pollers],
+                                             name='log_poller_stats'))
+schedule.every(3).minutes.do(job_runner.job('io', send_log_updates), topic_id=tg_topic_id)
+
+throughput_watchdog = ThroughputWatchdog(
+    on_stall=lambda reason: job_runner.submit('browser', 'recover_stalled', 'reload', recover_stalled, driver, reason),
+    on_alert=send_stuck_alert,
+    is_paused=lambda: not page_gate.is_set())
+throughput_watchdog.watch('ui_watcher', lambda: ui_watcher.last_drain)
+throughput_watchdog.start()
+schedule.every(10).minutes.do(job_runner.job('io', throughput_watchdog.log_stats, name='log_watchdog_stats'))
+schedule.every(10).minutes.do(job_runner.job('io', browser_monitor.log_stats, name='log_browser_stats'))
+
+if args.metrics_file:
+    schedule.every(30).seconds.do(job_runner.job('io', write_metrics_file))
+if args.metrics_port:
+    metrics.serve(args.metrics_port)
 
 scheduler_thread = threading.Thread(target=run_scheduler)
 scheduler_thread.start()
 
-incoming_request_listener_thread = threading.Thread(target=incoming_requests_listener)
-incoming_request_listener_thread.start()
-
-duel_request_listener_thread = threading.Thread(target=duel_request_listener)
-duel_request_listener_thread.start()
-
-duel_opponent_search_thread = threading.Thread(target=duel_opponent_search)
-duel_opponent_search_thread.start()
+if args.runtime == 'asyncio':
+    async_runtime = AsyncRuntime(get_page_ws_url(get_debugger_address(driver), driver.current_window_handle),
+                                 driver_executor, plan_search, respond_to_duel_request, search_done, click_script,
+                                 recorder=command_stats, search_poller=opponent_search_poller,
+                                 capture_frame=lambda: capture_frame(driver)[2:])
+    async_runtime.start()
+else:
+    incoming_request_listener_thread = threading.Thread(target=incoming_requests_listener)
+    incoming_request_listener_thread.start()
+
+    duel_request_listener_thread = threading.Thread(target=duel_request_listener)
+    duel_request_listener_thread.start()
+
+    duel_opponent_search_thread = threading.Thread(target=duel_opponent_search)
+    duel_opponent_search_thread.start()
@@ -0,0 +1,162 @@
+import itertools
+import json
+import logging
+import threading
+import time
+
+import requests
+import websocket
+
+from command_stats import calling_function
+
+logger = logging.getLogger('my_application')
+
+
+def get_debugger_address(driver):
+    return driver.capabilities['goog:chromeOptions']['debuggerAddress']
+
+
+def get_page_ws_url(debugger_address, target_id=None):
+    """
+    Find the DevTools websocket url of a page target.
+
+    :param debugger_address: host:port of the Chrome remote debugging endpoint
+    :param target_id: target to look for, chromedriver window handles are target ids
+    """
+    targets = requests.get(f'http://{debugger_address}/json', timeout=5).json()
+    pages = [target for target in targets if target.get('type') == 'page']
+    for target in pages:
+        if target_id and target['id'].lower() == target_id.lower():
+            return target['webSocketDebuggerUrl']
+    if not pages:
+        raise Exception(f'No page targets found on {debugger_address}')
+    return pages[0]['webSocketDebuggerUrl']
+
+
+def get_browser_ws_url(debugger_address):
+    """
+    DevTools websocket url of the browser itself, for domains that are not per page like SystemInfo.
+    """
+    return requests.get(f'http://{debugger_address}/json/version', timeout=5).json()['webSocketDebuggerUrl']
+
+
+class CDPSession:
+    """
+    Minimal DevTools protocol client over a page websocket.
+
+    Commands block until their response arrives, events are dispatched to callbacks on the
+    receiver thread, so callbacks must not call send() themselves (use notify()).
+    """
+
+    def __init__(self, ws_url, timeout=10, recorder=None):
+        self.ws_url = ws_url
+        self.timeout = timeout
+        self.recorder = recorder
+        self.ws = websocket.create_connection(ws_url, timeout=timeout, suppress_origin=True)
+        self.ws.settimeout(None)
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._callbacks = {}
+        self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receiver.start()
+
+    @classmethod
+    def from_driver(cls, driver, timeout=10, recorder=None):
+        ws_url = get_page_ws_url(get_debugger_address(driver), driver.current_window_handle)
+        return cls(ws_url, timeout, recorder)
+
+    def _receive_loop(self):
+        while not self.closed:
+            try:
+                message = json.loads(self.ws.recv())
+            except Exception as e:
+                if not self.closed:
+                    logger.error(f'DevTools connection lost: {e}')
+                    self.closed = True
+                break
+
+            if 'id' in message:
+                with self._pending_lock:
+                    waiter = self._pending.pop(message['id'], None)
+                if waiter:
+                    waiter['response'] = message
+                    waiter['event'].set()
+                continue
+
+            for callback in list(self._callbacks.get(message.get('method'), [])):
+                try:
+                    callback(message.get('params', {}))
+                except Exception as e:
+                    logger.error(f'DevTools callback for {message.get("method")} failed: {e}')
+
+        # Wake up everyone still waiting for a response
+        with self._pending_lock:
+            for waiter in self._pending.values():
+                waiter['event'].set()
+            self._pending.clear()
+
+    def _encode(self, method, params):
+        message_id = next(self._ids)
+        payload = json.dumps({'id': message_id, 'method': method, 'params': params or {}})
+        return message_id, payload
+
+    def notify(self, method, params=None):
+        """
+        Send a command without waiting for its response.
+        """
+        message_id, payload = self._encode(method, params)
+        with self._send_lock:
+            self.ws.send(payload)
+        return message_id
+
+    def send(self, method, params=None, timeout=None):
+        if self.closed:
+            raise Exception(f'DevTools session is closed, cannot send {method}')
+
+        start_time = time.perf_counter()
+        outcome = 'exception'
+        try:
+            response = self._send(method, params, timeout)
+            outcome = 'error' if 'error' in response else 'success'
+        finally:
+            if self.recorder is not None:
+                self.recorder.record(method, calling_function(), time.perf_counter() - start_time, outcome)
+
+        if 'error' in response:
+            raise Exception(f'DevTools command {method} failed: {response["error"].get("message")}')
+        return response.get('result', {})
+
+    def _send(self, method, params, timeout):
+        message_id, payload = self._encode(method, params)
+        waiter = {'event': threading.Event(), 'response': None}
+        with self._pending_lock:
+            self._pending[message_id] = waiter
+        with self._send_lock:
+            self.ws.send(payload)
+
+        if not waiter['event'].wait(timeout or self.timeout):
+            with self._pending_lock:
+                self._pending.pop(message_id, None)
+            raise Exception(f'DevTools command {method} timed out')
+
+        response = waiter['response']
+        if response is None:
+            raise Exception(f'DevTools session closed while waiting for {method}')
+        return response
+
+    def on(self, event, callback):
+        self._callbacks.setdefault(event, []).append(callback)
+
+    def off(self, event, callback):
+        if callback in self._callbacks.get(event, []):
+            self._callbacks[event].remove(callback)
+
+    def close(self):
+        self.closed = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
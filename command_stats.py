@@ -0,0 +1,167 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last bucket takes the rest
+latency_buckets_ms = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+bot_root = os.path.dirname(os.path.abspath(__file__))
+
+# Decorator wrappers that hide the function that actually issued the command
+wrapper_names = {'wrapper', 'switch', 'decorator'}
+
+# Modules that only carry commands, their frames are never reported as the caller
+transport_files = {os.path.abspath(__file__), os.path.join(bot_root, 'cdp.py'), os.path.join(bot_root, 'async_cdp.py')}
+
+# Page helpers called from bot functions, the command is reported for the function that called them.
+# When nothing outside them is on the stack (e.g. the UI watcher's own thread) the helper is reported
+helper_files = {os.path.join(bot_root, name) for name in ('page_wait.py', 'ui_watcher.py', 'ui_state.py',
+                                                          'render_budget.py', 'interface_cleanup.py',
+                                                          'frame_source.py')}
+
+
+def calling_function(skip=1):
+    """
+    Name of the innermost bot function on the current stack, library, wrapper and helper frames are skipped.
+    """
+    frame = sys._getframe(skip)
+    helper = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        name = frame.f_code.co_name
+        if (filename.startswith(bot_root) and filename not in transport_files and 'site-packages' not in filename
+                and name not in wrapper_names):
+            if filename not in helper_files:
+                return name
+            helper = helper or name
+        frame = frame.f_back
+    return helper or 'unknown'
+
+
+def webdriver_outcome(response):
+    """
+    'success' or the W3C error code of a raw command executor response, e.g. 'no such element'.
+    """
+    if not isinstance(response, dict):
+        return 'success'
+    value = response.get('value')
+    if isinstance(value, dict) and value.get('error'):
+        return value['error']
+    status = response.get('status')
+    if status not in (None, 0, 200, 'success'):
+        return str(status)
+    return 'success'
+
+
+class CommandStats:
+    """
+    Counts every WebDriver and DevTools command by (command, calling function) per minute, with
+    outcome counts and a latency histogram. Only the last `keep_minutes` minutes are kept.
+    """
+
+    def __init__(self, keep_minutes=60):
+        self.keep_minutes = keep_minutes
+        self.minutes = collections.OrderedDict()
+        self.totals = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, command, caller, latency, outcome='success'):
+        minute = int(time.time() // 60)
+        bucket = 0
+        latency_ms = latency * 1000
+        while bucket < len(latency_buckets_ms) and latency_ms > latency_buckets_ms[bucket]:
+            bucket += 1
+
+        with self._lock:
+            commands = self.minutes.get(minute)
+            if commands is None:
+                commands = self.minutes[minute] = {}
+                while len(self.minutes) > self.keep_minutes:
+                    self.minutes.popitem(last=False)
+            entry = commands.get((command, caller))
+            if entry is None:
+                entry = commands[(command, caller)] = {'count': 0, 'latency_total': 0, 'latency_max': 0,
+                                                       'outcomes': collections.Counter(),
+                                                       'histogram': [0] * (len(latency_buckets_ms) + 1)}
+            entry['count'] += 1
+            entry['latency_total'] += latency
+            entry['latency_max'] = max(entry['latency_max'], latency)
+            entry['outcomes'][outcome] += 1
+            entry['histogram'][bucket] += 1
+            self.totals[outcome] += 1
+
+    def summary(self, minutes=10):
+        """
+        Merge the last `minutes` minutes into {(command, caller): entry}.
+        """
+        since = int(time.time() // 60) - minutes + 1
+        merged = {}
+        with self._lock:
+            for minute, commands in self.minutes.items():
+                if minute < since:
+                    continue
+                for key, entry in commands.items():
+                    total = merged.get(key)
+                    if total is None:
+                        total = merged[key] = {'count': 0, 'latency_total': 0, 'latency_max': 0,
+                                               'outcomes': collections.Counter(),
+                                               'histogram': [0] * (len(latency_buckets_ms) + 1)}
+                    total['count'] += entry['count']
+                    total['latency_total'] += entry['latency_total']
+                    total['latency_max'] = max(total['latency_max'], entry['latency_max'])
+                    total['outcomes'].update(entry['outcomes'])
+                    total['histogram'] = [a + b for a, b in zip(total['histogram'], entry['histogram'])]
+        return merged
+
+    def log_summary(self, minutes=10, top=15):
+        merged = self.summary(minutes)
+        count = sum(entry['count'] for entry in merged.values())
+        failed = sum(entry['count'] - entry['outcomes']['success'] for entry in merged.values())
+        logger.info(f'Commands in the last {minutes} minutes: {count}, failed {failed} '
+                    f'({failed / max(count, 1) * 100:.1f}%)')
+        for (command, caller), entry in sorted(merged.items(), key=lambda item: -item[1]['count'])[:top]:
+            outcomes = ', '.join(f'{outcome} {n}' for outcome, n in entry['outcomes'].most_common())
+            logger.info(f'{caller} -> {command}: {entry["count"]} calls, '
+                        f'avg {entry["latency_total"] / entry["count"] * 1000:.1f}ms '
+                        f'p95 <= {histogram_quantile(entry["histogram"], 0.95)}ms, '
+                        f'max {entry["latency_max"] * 1000:.1f}ms ({outcomes})')
+
+
+def histogram_quantile(histogram, quantile):
+    """
+    Upper bound in ms of the bucket the quantile falls into, '+inf' for the overflow bucket.
+    """
+    target = sum(histogram) * quantile
+    seen = 0
+    for bound, count in zip(latency_buckets_ms + ('+inf',), histogram):
+        seen += count
+        if seen >= target:
+            return bound
+    return '+inf'
+
+
+def instrument_driver(driver, stats):
+    """
+    Wrap the driver's command executor so every WebDriver command is recorded in stats.
+    """
+    executor = driver.command_executor
+    execute = executor.execute
+
+    def execute_recorded(command, params):
+        caller = calling_function()
+        start_time = time.perf_counter()
+        try:
+            response = execute(command, params)
+        except Exception:
+            stats.record(command, caller, time.perf_counter() - start_time, 'exception')
+            raise
+        stats.record(command, caller, time.perf_counter() - start_time, webdriver_outcome(response))
+        return response
+
+    executor.execute = execute_recorded
+    return driver
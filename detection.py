@@ -0,0 +1,138 @@
+import random
+
+import cv2
+import numpy as np
+
+min_area_percentage = 0.002
+max_area_percentage = 0.01
+max_aspect_ratio = 1.8
+detection_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (4, 6))
+dilation_iterations = 3
+lower_pixel_border = np.array([146, 134, 43])
+upper_pixel_border = np.array([235, 190, 90])
+
+
+def distance_degree_for_load(server_load):
+    return np.linspace(1, 3.25, 10)[server_load - 1]
+
+
+def detection_area_bounds(img_w, img_h):
+    return img_w * img_h * min_area_percentage, img_w * img_h * max_area_percentage
+
+
+def detect_opponents(img, center_of_image, distance_from_center_degree, min_detection_area, max_detection_area):
+    """
+    Find opponent candidates on an RGB frame.
+
+    :return: (valid_rects, x_cords, y_cords, distances_to_center)
+    """
+    mask = np.all(img >= lower_pixel_border, axis=-1) & np.all(img <= upper_pixel_border, axis=-1)
+    img_dilation = cv2.dilate(mask.astype(np.uint8) * 255, detection_kernel, iterations=dilation_iterations)
+    contours, _ = cv2.findContours(img_dilation, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+    bounding_rects = np.array([cv2.boundingRect(cnt) for cnt in contours], dtype=int).reshape(-1, 4)
+    return filter_candidates(bounding_rects, center_of_image, distance_from_center_degree, min_detection_area,
+                             max_detection_area)
+
+
+def filter_candidates(bounding_rects, center_of_image, distance_from_center_degree, min_detection_area,
+                      max_detection_area):
+    areas = bounding_rects[:, 2] * bounding_rects[:, 3]
+    aspect_ratios = bounding_rects[:, 3] / np.maximum(bounding_rects[:, 2], 1)
+
+    # Filter based on area and aspect ratio
+    valid_filter = (min_detection_area < areas) & (areas < max_detection_area) & (aspect_ratios <= max_aspect_ratio)
+    valid_rects = bounding_rects[valid_filter]
+
+    # Calculate contour centers
+    x_cords = valid_rects[:, 0] + valid_rects[:, 2] // 2
+    y_cords = valid_rects[:, 1] + valid_rects[:, 3] // 2
+
+    # Calculate distances to the center of the image
+    distances_to_center = distances_to_point(x_cords, y_cords, center_of_image, distance_from_center_degree)
+
+    return valid_rects, x_cords, y_cords, distances_to_center
+
+
+def distances_to_point(x_cords, y_cords, point, distance_from_center_degree):
+    return np.linalg.norm(point - np.stack((x_cords, y_cords), axis=1), axis=1) ** distance_from_center_degree
+
+
+def select_candidate(x_cords, y_cords, distances_to_center):
+    """
+    Pick one of the candidates, preferring the ones close to the character.
+
+    Returns None when there are not enough candidates to choose from.
+    """
+    if distances_to_center.size <= 1:
+        return None
+
+    if random.random() > 0.9:
+        selected_index = np.random.choice(distances_to_center.shape[0])
+    else:
+        min_dist_index = np.argmin(distances_to_center)
+
+        # Exclude the point with the minimum distance from further calculations
+        distances_to_center = np.delete(distances_to_center, min_dist_index)
+        x_cords = np.delete(x_cords, min_dist_index)
+        y_cords = np.delete(y_cords, min_dist_index)
+
+        probabilities = 1 / (distances_to_center + 0.1)
+        probabilities /= probabilities.sum()
+
+        selected_index = np.random.choice(distances_to_center.shape[0], p=probabilities)
+
+    return x_cords[selected_index], y_cords[selected_index]
+
+
+class OpponentDetector:
+    """
+    Detector that reuses its frame-sized buffers between calls.
+
+    Works directly on BGR frames as returned by cv2.imdecode, or on RGBA frames read from the canvas.
+    """
+
+    def __init__(self, img_w, img_h, distance_from_center_degree):
+        self.distance_from_center_degree = distance_from_center_degree
+        # Pixel borders are defined in RGB, decoded frames are BGR
+        self.lower_border = tuple(int(v) for v in lower_pixel_border[::-1])
+        self.upper_border = tuple(int(v) for v in upper_pixel_border[::-1])
+        self.lower_border_rgba = tuple(int(v) for v in lower_pixel_border) + (0,)
+        self.upper_border_rgba = tuple(int(v) for v in upper_pixel_border) + (255,)
+        self._allocate(img_w, img_h)
+
+    def _allocate(self, img_w, img_h):
+        self.img_w = img_w
+        self.img_h = img_h
+        self.center_of_image = np.array((img_w // 2, img_h // 2))
+        self.min_detection_area, self.max_detection_area = detection_area_bounds(img_w, img_h)
+        self.mask = np.empty((img_h, img_w), np.uint8)
+        self.dilation = np.empty((img_h, img_w), np.uint8)
+        self.labels = np.empty((img_h, img_w), np.int32)
+
+    def detect(self, img, full_size=None):
+        """
+        Find opponent candidates on a BGR or RGBA frame.
+
+        :param full_size: (w, h) of the whole game view in frame pixels, when the frame is only a part of it
+        :return: (valid_rects, x_cords, y_cords, distances_to_center)
+        """
+        img_h, img_w, channels = img.shape
+        if (img_w, img_h) != (self.img_w, self.img_h):
+            self._allocate(img_w, img_h)
+
+        min_detection_area, max_detection_area = self.min_detection_area, self.max_detection_area
+        if full_size is not None:
+            min_detection_area, max_detection_area = detection_area_bounds(*full_size)
+
+        if channels == 4:
+            cv2.inRange(img, self.lower_border_rgba, self.upper_border_rgba, dst=self.mask)
+        else:
+            cv2.inRange(img, self.lower_border, self.upper_border, dst=self.mask)
+        cv2.dilate(self.mask, detection_kernel, dst=self.dilation, iterations=dilation_iterations)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(self.dilation, labels=self.labels, connectivity=8)
+
+        # The first component is the background
+        bounding_rects = stats[1:, :4]
+        return filter_candidates(bounding_rects, self.center_of_image, self.distance_from_center_degree,
+                                 min_detection_area, max_detection_area)
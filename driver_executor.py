@@ -0,0 +1,181 @@
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+import time
+import types
+
+logger = logging.getLogger('my_application')
+
+# Lower value runs first
+DUEL_RESPONSE = 0
+INCOMING_ACCEPT = 1
+OPPONENT_SEARCH = 2
+HOUSEKEEPING = 3
+
+priority_names = {
+    DUEL_RESPONSE: 'duel_response',
+    INCOMING_ACCEPT: 'incoming_accept',
+    OPPONENT_SEARCH: 'opponent_search',
+    HOUSEKEEPING: 'housekeeping',
+}
+
+
+class Task:
+    def __init__(self, priority, name, func, args, kwargs):
+        self.priority = priority
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.submitted = time.time()
+        self.started = None
+        self.generator = None
+        self.run_time = 0
+        self.yields = 0
+        self.preempted = 0
+
+
+class DriverExecutor:
+    """
+    Single thread that owns the WebDriver session and runs prioritised tasks on it.
+
+    A task is a plain function or a generator function. Generators yield a number of seconds to
+    pause for (instead of calling sleep), while a task is paused only tasks with a strictly higher
+    priority may run, which is how a duel response preempts an opponent search in progress while
+    housekeeping still has to wait for it to finish.
+    """
+
+    def __init__(self):
+        self._ready = []
+        self._parked = []
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self.current = None
+        self.stats = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, priority, name, func, *args, **kwargs):
+        task = Task(priority, name, func, args, kwargs)
+        with self._condition:
+            heapq.heappush(self._ready, (priority, 1, next(self._seq), task))
+            self._condition.notify()
+        return task.future
+
+    def run(self, priority, name, func, *args, timeout=None, **kwargs):
+        """
+        Run func on the executor and wait for its result.
+
+        Called from a task that is already on the executor thread, func runs inline.
+        """
+        if threading.current_thread() is self._thread:
+            result = func(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                result = run_inline(result)
+            return result
+        return self.submit(priority, name, func, *args, **kwargs).result(timeout)
+
+    def backlog(self):
+        with self._condition:
+            return len(self._ready) + len(self._parked)
+
+    def _next_task(self):
+        while True:
+            now = time.time()
+            for entry in [entry for entry in self._parked if entry[0] <= now]:
+                self._parked.remove(entry)
+                task = entry[1]
+                # Resumed tasks go ahead of tasks with the same priority that were held back by them
+                heapq.heappush(self._ready, (task.priority, 0, next(self._seq), task))
+
+            ceiling = min((task.priority for _, task in self._parked), default=None)
+            if self._ready and (ceiling is None or self._ready[0][0] < ceiling):
+                task = heapq.heappop(self._ready)[3]
+                for _, parked_task in self._parked:
+                    if parked_task.priority > task.priority and task.started is None:
+                        parked_task.preempted += 1
+                return task
+
+            wake_up = min((resume_at for resume_at, _ in self._parked), default=now + 1)
+            self._condition.wait(max(wake_up - now, 0.001))
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                task = self._next_task()
+            self._step(task)
+
+    def _step(self, task):
+        if task.started is None:
+            if not task.future.set_running_or_notify_cancel():
+                return
+            task.started = time.time()
+
+        self.current = task
+        step_start = time.time()
+        try:
+            if task.generator is None:
+                result = task.func(*task.args, **task.kwargs)
+                if not isinstance(result, types.GeneratorType):
+                    self._finish(task, result=result)
+                    return
+                task.generator = result
+            delay = next(task.generator)
+        except StopIteration as e:
+            self._finish(task, result=e.value)
+            return
+        except Exception as e:
+            self._finish(task, error=e)
+            return
+        finally:
+            task.run_time += time.time() - step_start
+            self.current = None
+
+        task.yields += 1
+        with self._condition:
+            self._parked.append((time.time() + (delay or 0), task))
+
+    def _finish(self, task, result=None, error=None):
+        finished = time.time()
+        stats = self.stats.setdefault(task.name, {'priority': priority_names.get(task.priority, task.priority),
+                                                  'count': 0, 'failures': 0, 'wait_total': 0, 'wait_max': 0,
+                                                  'run_total': 0, 'run_max': 0, 'wall_max': 0, 'preempted': 0})
+        wait_time = task.started - task.submitted
+        stats['count'] += 1
+        stats['failures'] += error is not None
+        stats['wait_total'] += wait_time
+        stats['wait_max'] = max(stats['wait_max'], wait_time)
+        stats['run_total'] += task.run_time
+        stats['run_max'] = max(stats['run_max'], task.run_time)
+        stats['wall_max'] = max(stats['wall_max'], finished - task.submitted)
+        stats['preempted'] += task.preempted
+
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
+
+    def log_stats(self):
+        for name, stats in sorted(self.stats.items()):
+            count = max(stats['count'], 1)
+            logger.info(f'Task {name} ({stats["priority"]}): {stats["count"]} runs, {stats["failures"]} failed, '
+                        f'wait avg {stats["wait_total"] / count:.3f}s max {stats["wait_max"]:.3f}s, '
+                        f'run avg {stats["run_total"] / count:.3f}s max {stats["run_max"]:.3f}s, '
+                        f'wall max {stats["wall_max"]:.3f}s, preempted {stats["preempted"]} times')
+
+
+def run_inline(generator):
+    """
+    Run a generator task to completion on the current thread, sleeping where it yields.
+    """
+    try:
+        while True:
+            time.sleep(next(generator) or 0)
+    except StopIteration as e:
+        return e.value
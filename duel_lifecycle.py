@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+REQUESTED = 'requested'
+ACCEPTED = 'accepted'
+ENTERING = 'entering'
+FIGHTING = 'fighting'
+REWARD = 'reward'
+IDLE = 'idle'
+
+phases = [REQUESTED, ACCEPTED, ENTERING, FIGHTING, REWARD]
+
+
+class PhaseTimeout(Exception):
+    """
+    Raised by a phase handler when the UI event that ends the phase did not come in time.
+    """
+
+
+class DuelLifecycle:
+    """
+    Runs a duel as a state machine, requested -> accepted -> entering -> fighting -> reward -> idle.
+
+    Each phase has a handler that waits for the UI event ending it and returns the next phase, or
+    IDLE with an outcome when the duel ends early. Time spent in every phase is recorded, so it is
+    visible where the wall-clock time of a duel goes.
+
+    :param handlers: {phase: callable(timeout) -> next phase or (IDLE, outcome)}
+    :param timeouts: {phase: seconds}, passed to the handler
+    :param on_phase: callable(phase, duration, timed_out) called when a phase ends
+    :param on_finish: callable(outcome, duration) called when the duel is back to idle
+    """
+
+    def __init__(self, handlers, timeouts, on_phase=None, on_finish=None):
+        self.handlers = handlers
+        self.timeouts = timeouts
+        self.on_phase = on_phase
+        self.on_finish = on_finish
+        self.phase = IDLE
+        self.phase_started = None
+        self.stats = {phase: {'count': 0, 'timeouts': 0, 'total': 0, 'max': 0} for phase in phases}
+        self.outcomes = {}
+        self._lock = threading.Lock()
+
+    def _end_phase(self, timed_out=False):
+        duration = time.time() - self.phase_started
+        with self._lock:
+            stats = self.stats[self.phase]
+            stats['count'] += 1
+            stats['timeouts'] += timed_out
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+        if self.on_phase is not None:
+            self.on_phase(self.phase, duration, timed_out)
+
+    def run(self):
+        """
+        Run a duel from the request to idle.
+
+        :return: outcome, 'finished' when the reward popup was closed
+        """
+        started = time.time()
+        self.phase = REQUESTED
+        outcome = 'finished'
+        try:
+            while self.phase != IDLE:
+                self.phase_started = time.time()
+                logger.debug(f'Duel phase: {self.phase}')
+                try:
+                    result = self.handlers[self.phase](self.timeouts.get(self.phase))
+                except PhaseTimeout as e:
+                    logger.debug(f'Duel phase {self.phase} timed out: {e}')
+                    self._end_phase(timed_out=True)
+                    outcome = f'{self.phase}_timeout'
+                    break
+                except Exception:
+                    self._end_phase()
+                    outcome = f'{self.phase}_error'
+                    raise
+                self._end_phase()
+                if isinstance(result, tuple):
+                    self.phase, outcome = result
+                else:
+                    self.phase = result
+        finally:
+            self.phase = IDLE
+            duration = time.time() - started
+            with self._lock:
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if self.on_finish is not None:
+                self.on_finish(outcome, duration)
+        return outcome
+
+    def log_stats(self):
+        logger.info(f'Duel outcomes: {self.outcomes}')
+        for phase in phases:
+            stats = self.stats[phase]
+            count = max(stats['count'], 1)
+            logger.info(f'Duel phase {phase}: {stats["count"]} times, {stats["timeouts"]} timed out, '
+                        f'avg {stats["total"] / count:.1f}s max {stats["max"]:.1f}s')
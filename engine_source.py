@@ -0,0 +1,109 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('my_application')
+
+# Finds the Excalibur engine once, then returns client coordinates of every visible actor whose name
+# matches the pattern, how many actors matched at all and a few actor names to help fix a pattern that
+# matches nothing. Returns null when the engine can not be found.
+engine_actors_script = """
+var pattern = new RegExp(arguments[0], 'i');
+var engine = window.__botEngine;
+if (!engine || !engine.currentScene) {
+    engine = null;
+    var names = Object.getOwnPropertyNames(window);
+    for (var i = 0; i < names.length && !engine; i++) {
+        try {
+            var value = window[names[i]];
+            if (value && value.currentScene && value.currentScene.actors &&
+                    typeof value.worldToScreenCoordinates === 'function') {
+                engine = value;
+            }
+        } catch (e) {
+        }
+    }
+    if (!engine) {
+        return null;
+    }
+    window.__botEngine = engine;
+}
+var rect = engine.canvas.getBoundingClientRect();
+var viewport = (engine.screen && engine.screen.viewport) || {width: rect.width, height: rect.height};
+var scaleX = rect.width / viewport.width;
+var scaleY = rect.height / viewport.height;
+var positions = [];
+var matched = 0;
+var names = [];
+engine.currentScene.actors.forEach(function (actor) {
+    if (actor.name && names.length < 10 && names.indexOf(actor.name) === -1) {
+        names.push(actor.name);
+    }
+    if (!actor.name || !pattern.test(actor.name)) {
+        return;
+    }
+    matched++;
+    if (actor.visible === false || (actor.isKilled && actor.isKilled())) {
+        return;
+    }
+    var screen = engine.worldToScreenCoordinates(actor.pos);
+    var x = rect.left + screen.x * scaleX;
+    var y = rect.top + screen.y * scaleY;
+    if (x >= rect.left && x <= rect.right && y >= rect.top && y <= rect.bottom) {
+        positions.push([x, y]);
+    }
+});
+return {positions: positions, matched: matched, names: names};
+"""
+
+
+class EngineOpponentSource:
+    """
+    Reads player positions straight from the game engine in one execute_script call.
+
+    A read without an engine, or where actor_pattern matches no actor in the scene, is a failure
+    and the caller falls back to the colour-mask detector. After max_failures of them in a row it
+    stops trying, so the caller keeps using the detector without paying for the extra script call.
+    """
+
+    def __init__(self, driver, actor_pattern='player', max_failures=10):
+        self.driver = driver
+        self.actor_pattern = actor_pattern
+        self.max_failures = max_failures
+        self.failures = 0
+        self.pattern_warned = False
+
+    @property
+    def available(self):
+        return self.failures < self.max_failures
+
+    def candidates(self):
+        """
+        :return: (x_cords, y_cords) in tab coordinates, or None when the engine state can not be read
+            or no actor matches actor_pattern
+        """
+        if not self.available:
+            return None
+
+        try:
+            result = self.driver.execute_script(engine_actors_script, self.actor_pattern)
+        except Exception as e:
+            logger.debug(f'Failed to read actors from the game engine: {e}')
+            result = None
+
+        if result is not None and not result['matched']:
+            if not self.pattern_warned:
+                self.pattern_warned = True
+                logger.warning(f'Engine actor pattern {self.actor_pattern!r} matches no actor, '
+                               f'actor names: {result["names"]}')
+            result = None
+
+        if result is None:
+            self.failures += 1
+            if not self.available:
+                logger.error('No players found in the game engine, using colour detection for opponent search')
+            return None
+
+        self.failures = 0
+        positions = np.array(result['positions'], dtype=float).reshape(-1, 2)
+        return positions[:, 0], positions[:, 1]
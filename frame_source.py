@@ -0,0 +1,234 @@
+import base64
+import collections
+import json
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger('my_application')
+
+Frame = collections.namedtuple('Frame', ['seq', 'timestamp', 'data', 'format', 'metadata'])
+
+
+def decode_frame(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class ScreencastFrameSource:
+    """
+    Keeps the latest frames pushed by the DevTools screencast in memory.
+
+    Chrome only sends a frame when the page actually repaints, and holds the next one back until
+    the previous one is acknowledged. Frames are only acknowledged when latest() asks for one, so
+    Chrome encodes about one frame per capture instead of every repaint of the game.
+    Frames are PNG by default, the detector's colour borders were tuned on lossless screenshots
+    and JPEG artifacts shift colours at sprite edges.
+    """
+
+    def __init__(self, session, max_frames=4, image_format='png', quality=80, max_width=None, max_height=None,
+                 every_nth_frame=1):
+        self.session = session
+        self.frames = collections.deque(maxlen=max_frames)
+        self.params = {'format': image_format, 'quality': quality, 'everyNthFrame': every_nth_frame}
+        if max_width:
+            self.params['maxWidth'] = max_width
+        if max_height:
+            self.params['maxHeight'] = max_height
+        self.image_format = image_format
+        self.started = False
+        self._seq = 0
+        self._unacked = None
+        self._condition = threading.Condition()
+        self._decoded_seq = None
+        self._decoded = None
+
+    def start(self):
+        self.session.on('Page.screencastFrame', self._on_frame)
+        self.session.send('Page.startScreencast', self.params)
+        self.started = True
+        logger.debug('Screencast started')
+
+    def stop(self):
+        self.started = False
+        with self._condition:
+            self._unacked = None
+        self.session.off('Page.screencastFrame', self._on_frame)
+        try:
+            self.session.send('Page.stopScreencast')
+        except Exception as e:
+            logger.debug(f'Failed to stop screencast: {e}')
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def _on_frame(self, params):
+        # Not acknowledged here, Chrome sends nothing more until latest() wants a frame
+        with self._condition:
+            self._seq += 1
+            self._unacked = params['sessionId']
+            self.frames.append(Frame(self._seq, time.time(), base64.b64decode(params['data']), self.image_format,
+                                     params.get('metadata', {})))
+            self._condition.notify_all()
+
+    def latest(self, newer_than=None, timeout=0):
+        """
+        Return the latest frame, optionally waiting up to timeout seconds for one newer than seq newer_than.
+
+        A frame still waiting for its ack was painted whenever the previous capture let Chrome go on, so
+        with a timeout it is acknowledged and the next repaint is waited for, the held frame is only
+        returned when none comes in time.
+        """
+        with self._condition:
+            held = self._seq if self._unacked is not None else None
+            if self._unacked is not None:
+                self.session.notify('Page.screencastFrameAck', {'sessionId': self._unacked})
+                self._unacked = None
+            if timeout:
+                seqs = [seq for seq in (newer_than, held) if seq is not None]
+                if seqs:
+                    self._condition.wait_for(lambda: self.frames and self.frames[-1].seq > max(seqs), timeout)
+            return self.frames[-1] if self.frames else None
+
+    def latest_image(self, newer_than=None, timeout=0, max_age=None):
+        """
+        Decode the latest frame to a BGR image, the decoded image is cached per frame.
+
+        :return: (frame, image) or (None, None) when there is no frame or it is older than max_age seconds
+        """
+        frame = self.latest(newer_than, timeout)
+        if frame is None or (max_age is not None and time.time() - frame.timestamp > max_age):
+            return None, None
+        if self._decoded_seq != frame.seq:
+            self._decoded = decode_frame(frame.data)
+            self._decoded_seq = frame.seq
+        return frame, self._decoded
+
+
+CaptureRegion = collections.namedtuple('CaptureRegion', ['offset_x', 'offset_y', 'scale_x', 'scale_y', 'full_w',
+                                                         'full_h'])
+
+canvas_pixels_script = """
+(function (selector, clipRatio) {
+    var canvas = document.querySelector(selector);
+    if (!canvas) {
+        return null;
+    }
+    var rect = canvas.getBoundingClientRect();
+    var w = Math.round(canvas.width * clipRatio);
+    var h = Math.round(canvas.height * clipRatio);
+    var sx = Math.round((canvas.width - w) / 2);
+    var sy = Math.round((canvas.height - h) / 2);
+    var scratch = window.__botCaptureCanvas || (window.__botCaptureCanvas = document.createElement('canvas'));
+    if (scratch.width !== w || scratch.height !== h) {
+        scratch.width = w;
+        scratch.height = h;
+    }
+    var ctx = scratch.getContext('2d', {willReadFrequently: true});
+    ctx.drawImage(canvas, sx, sy, w, h, 0, 0, w, h);
+    var pixels = ctx.getImageData(0, 0, w, h).data;
+    var chunks = [];
+    for (var i = 0; i < pixels.length; i += 0x8000) {
+        chunks.push(String.fromCharCode.apply(null, pixels.subarray(i, i + 0x8000)));
+    }
+    return {data: btoa(chunks.join('')), width: w, height: h, sx: sx, sy: sy,
+            canvasWidth: canvas.width, canvasHeight: canvas.height,
+            left: rect.left, top: rect.top, cssWidth: rect.width, cssHeight: rect.height};
+})(%s, %s)
+"""
+
+canvas_rect_script = """
+(function (selector) {
+    var canvas = document.querySelector(selector);
+    if (!canvas) {
+        return null;
+    }
+    var rect = canvas.getBoundingClientRect();
+    return {left: rect.left, top: rect.top, width: rect.width, height: rect.height};
+})(%s)
+"""
+
+
+def evaluate(session, expression):
+    result = session.send('Runtime.evaluate', {'expression': expression, 'returnByValue': True})
+    if 'exceptionDetails' in result:
+        raise Exception(f'Script failed: {result["exceptionDetails"].get("text")}')
+    return result['result'].get('value')
+
+
+class CanvasFrameSource:
+    """
+    Captures only the game canvas, optionally a centered part of it around the character.
+
+    mode='raw' copies the canvas pixels through a 2D canvas and returns them as an RGBA view over
+    the transferred bytes, mode='jpeg' asks Chrome for a low quality JPEG of the canvas rect.
+    The returned CaptureRegion maps frame pixels back to page coordinates.
+    """
+
+    def __init__(self, session, selector='#game canvas', mode='raw', clip_ratio=1.0, quality=40, rect_ttl=10):
+        self.session = session
+        self.selector = selector
+        self.mode = mode
+        self.clip_ratio = clip_ratio
+        self.quality = quality
+        self.rect_ttl = rect_ttl
+        self._rect = None
+        self._rect_time = 0
+        self.blank_frames = 0
+
+    def capture(self):
+        """
+        :return: (data, format, image, region) or None if the canvas is not on the page or read back blank
+        """
+        if self.mode == 'raw':
+            return self._capture_raw()
+        return self._capture_jpeg()
+
+    def _capture_raw(self):
+        result = evaluate(self.session, canvas_pixels_script % (json.dumps(self.selector), self.clip_ratio))
+        if not result:
+            return None
+
+        data = base64.b64decode(result['data'])
+        img = np.frombuffer(data, np.uint8).reshape(result['height'], result['width'], 4)
+        # A WebGL canvas without preserveDrawingBuffer reads back as all zeros outside its frame
+        # callback, that is a failed capture and not an empty map
+        if not img.any():
+            self.blank_frames += 1
+            if self.blank_frames == 1:
+                logger.warning('Canvas capture returned a blank frame, falling back to screenshots')
+            return None
+        scale_x = result['cssWidth'] / result['canvasWidth']
+        scale_y = result['cssHeight'] / result['canvasHeight']
+        region = CaptureRegion(result['left'] + result['sx'] * scale_x, result['top'] + result['sy'] * scale_y,
+                               scale_x, scale_y, result['canvasWidth'], result['canvasHeight'])
+        return data, 'raw', img, region
+
+    def _canvas_rect(self):
+        if self._rect is None or time.time() - self._rect_time > self.rect_ttl:
+            self._rect = evaluate(self.session, canvas_rect_script % json.dumps(self.selector))
+            self._rect_time = time.time()
+        return self._rect
+
+    def _capture_jpeg(self):
+        rect = self._canvas_rect()
+        if not rect:
+            return None
+
+        clip_w = rect['width'] * self.clip_ratio
+        clip_h = rect['height'] * self.clip_ratio
+        clip = {'x': rect['left'] + (rect['width'] - clip_w) / 2, 'y': rect['top'] + (rect['height'] - clip_h) / 2,
+                'width': clip_w, 'height': clip_h, 'scale': 1}
+        result = self.session.send('Page.captureScreenshot', {'format': 'jpeg', 'quality': self.quality, 'clip': clip,
+                                                              'optimizeForSpeed': True})
+        data = base64.b64decode(result['data'])
+        img = decode_frame(data)
+        img_h, img_w = img.shape[:2]
+        scale_x = clip_w / img_w
+        scale_y = clip_h / img_h
+        region = CaptureRegion(clip['x'], clip['y'], scale_x, scale_y, rect['width'] / scale_x,
+                               rect['height'] / scale_y)
+        return data, 'jpeg', img, region
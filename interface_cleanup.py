@@ -0,0 +1,166 @@
+import re
+
+hidden_selectors = [
+    "div[class*='minimap-subcontainer']",
+    "div[class*='toolbar-buttons']",
+    "div[class*='excalibur-container']",
+    "div[class*='modifiers-container']",
+    "div[class*='announcement-message-container']",
+    "div[class*='navigation-bar']",
+    "section#main-wip-disclaimer",
+    "div[class*='relative left']",
+    "div[class*='combat-ui-container']",
+    "div[class*='tab-switcher-container']",
+    "div[class*='navigation-content']",
+    "section[class*='message-form']",
+    "button[class*='new-btn']",
+    "aside#main-layout-left-aside",
+]
+
+# Hidden nodes stay in the DOM, XPaths that click must not match a hidden duplicate inside them
+def selector_to_xpath_condition(selector):
+    """
+    XPath condition for the `tag[class*='name']` and `tag#id` selectors used above.
+    """
+    match = re.fullmatch(r"(\w+)\[class\*='([^']+)'\]", selector)
+    if match:
+        return f"self::{match.group(1)} and contains(@class, '{match.group(2)}')"
+    tag, element_id = selector.split('#')
+    return f"self::{tag} and @id='{element_id}'"
+
+
+hidden_ancestor_condition = ' or '.join(f'({selector_to_xpath_condition(selector)})' for selector in hidden_selectors)
+
+
+def outside_hidden(xpath):
+    """
+    Restrict xpath to elements that are not inside a container hidden by the cleanup stylesheet.
+    """
+    return f'{xpath}[not(ancestor-or-self::*[{hidden_ancestor_condition}])]'
+
+
+# Animated widgets keep running even when hidden, these are removed as soon as they are added
+removed_selectors = [
+    "div[class*='confetti-holder']",
+    "div[class*='scrolling-text']",
+]
+
+# Chat messages pile up on busy servers and every text XPath scans them, only the newest are kept.
+# Messages the bot still has to read (bug texts, incoming duel requests) are never pruned
+chat_selector = '.messages-list.h-full.overflow-y-auto.p-2'
+chat_keep_messages = 20
+chat_protected_texts = ['Accept']
+
+style_rules = """
+aside[class*='minimap-window'] {
+    width: 0 !important;
+    height: 0 !important;
+}
+aside.chat-window {
+    left: 0px !important;
+    bottom: 0px !important;
+    width: 150px !important;
+    height: 90px !important;
+    min-width: 150px !important;
+}
+"""
+
+install_script = """
+var hiddenSelectors = arguments[0];
+var removedSelectors = arguments[1];
+var styleRules = arguments[2];
+var chatSelector = arguments[3];
+var chatKeep = arguments[4];
+var chatProtected = arguments[5];
+var cleanup = window.__botCleanup || (window.__botCleanup = {removed: 0, chatDiscarded: 0});
+if (document.getElementById('bot-cleanup-style')) {
+    return cleanup.removed;
+}
+
+var style = document.createElement('style');
+style.id = 'bot-cleanup-style';
+style.textContent = hiddenSelectors.join(',\\n') + ' {\\n    display: none !important;\\n}\\n' + styleRules;
+document.head.appendChild(style);
+cleanup.hiddenSelector = hiddenSelectors.join(', ');
+
+var removeSelector = removedSelectors.join(', ');
+function prune(root) {
+    root.querySelectorAll(removeSelector).forEach(function (node) {
+        node.remove();
+        cleanup.removed++;
+    });
+}
+prune(document);
+
+function isProtected(message) {
+    var text = message.textContent;
+    return chatProtected.some(function (protectedText) {
+        return text.indexOf(protectedText) !== -1;
+    });
+}
+
+// The first message is the welcome message, the rest is trimmed to the newest chatKeep, oldest first
+// and skipping protected messages
+function pruneChat(list) {
+    var index = 1;
+    while (list.children.length > chatKeep + 1 && index < list.children.length - chatKeep) {
+        var message = list.children[index];
+        if (isProtected(message)) {
+            index++;
+            continue;
+        }
+        list.removeChild(message);
+        cleanup.chatDiscarded++;
+    }
+}
+document.querySelectorAll(chatSelector).forEach(pruneChat);
+
+if (cleanup.observer) {
+    cleanup.observer.disconnect();
+}
+cleanup.observer = new MutationObserver(function (mutations) {
+    var chats = new Set();
+    mutations.forEach(function (mutation) {
+        if (mutation.target.nodeType === Node.ELEMENT_NODE && mutation.target.matches(chatSelector)) {
+            chats.add(mutation.target);
+        }
+        mutation.addedNodes.forEach(function (node) {
+            if (node.nodeType !== Node.ELEMENT_NODE || !node.isConnected) {
+                return;
+            }
+            if (node.matches(removeSelector)) {
+                node.remove();
+                cleanup.removed++;
+            } else {
+                prune(node);
+                if (node.matches(chatSelector)) {
+                    chats.add(node);
+                }
+            }
+        });
+    });
+    chats.forEach(pruneChat);
+});
+cleanup.observer.observe(document.body, {childList: true, subtree: true});
+return cleanup.removed;
+"""
+
+# Nodes removed by the observer plus nodes currently hidden by the stylesheet, null when not installed
+suppressed_nodes_expression = """(window.__botCleanup && document.getElementById('bot-cleanup-style') ?
+    window.__botCleanup.removed + document.querySelectorAll(window.__botCleanup.hiddenSelector).length : null)"""
+
+# Chat messages discarded by the observer, null when not installed
+chat_discarded_expression = """(window.__botCleanup && document.getElementById('bot-cleanup-style') ?
+    window.__botCleanup.chatDiscarded : null)"""
+
+
+def install_interface_cleanup(driver, keep_messages=chat_keep_messages, protected_texts=()):
+    """
+    Inject the cleanup stylesheet and observer, does nothing if they are already on the page.
+
+    :param keep_messages: chat messages the observer keeps besides the welcome message
+    :param protected_texts: chat messages containing one of these are kept on top of chat_protected_texts
+    :return: number of nodes removed by the observer so far
+    """
+    return driver.execute_script(install_script, hidden_selectors, removed_selectors, style_rules, chat_selector,
+                                 keep_messages, chat_protected_texts + list(protected_texts))
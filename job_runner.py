@@ -0,0 +1,101 @@
+import concurrent.futures
+import logging
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+
+class JobRunner:
+    """
+    Runs scheduled jobs on worker lanes instead of the scheduler thread.
+
+    Each lane has its own thread pool, so a slow browser job (a reload takes a minute) does not
+    hold up I/O jobs like shipping logs. A job that is still queued or running when it is triggered
+    again is skipped, and jobs that share a group skip each other, e.g. no reload job starts while
+    another reload job is in progress.
+
+    :param lanes: {lane: number of workers}
+    :param wrappers: {lane: callable(func, *args, **kwargs)} every job on the lane is run through,
+        e.g. to hand browser jobs to the DriverExecutor
+    """
+
+    def __init__(self, lanes, wrappers=None):
+        self.pools = {lane: concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix=f'jobs-{lane}')
+                      for lane, workers in lanes.items()}
+        self.wrappers = wrappers or {}
+        self.queued = {lane: 0 for lane in lanes}
+        self.stats = {}
+        self._active_groups = set()
+        self._lock = threading.Lock()
+
+    def job(self, lane, func, group=None, name=None):
+        """
+        Wrap func so calling it submits a run to the lane, pass the result to schedule's do().
+        """
+        name = name or func.__name__
+        group = group or name
+
+        def trigger(*args, **kwargs):
+            self.submit(lane, name, group, func, *args, **kwargs)
+
+        trigger.__name__ = name
+        return trigger
+
+    def _job_stats(self, name, lane):
+        return self.stats.setdefault(name, {'lane': lane, 'runs': 0, 'failures': 0, 'skipped': 0,
+                                            'duration_total': 0, 'duration_max': 0,
+                                            'lateness_total': 0, 'lateness_max': 0})
+
+    def submit(self, lane, name, group, func, *args, **kwargs):
+        with self._lock:
+            stats = self._job_stats(name, lane)
+            if group in self._active_groups:
+                stats['skipped'] += 1
+                logger.debug(f'Job {name} skipped, {group} is still running')
+                return None
+            self._active_groups.add(group)
+            self.queued[lane] += 1
+        return self.pools[lane].submit(self._run, lane, name, group, time.time(), func, args, kwargs)
+
+    def _run(self, lane, name, group, triggered, func, args, kwargs):
+        start_time = time.time()
+        with self._lock:
+            self.queued[lane] -= 1
+        error = None
+        try:
+            wrapper = self.wrappers.get(lane)
+            if wrapper is not None:
+                return wrapper(func, *args, **kwargs)
+            return func(*args, **kwargs)
+        except Exception as e:
+            error = e
+            logger.error(f'Job {name} failed: {e}')
+        finally:
+            duration = time.time() - start_time
+            lateness = start_time - triggered
+            with self._lock:
+                self._active_groups.discard(group)
+                stats = self._job_stats(name, lane)
+                stats['runs'] += 1
+                stats['failures'] += error is not None
+                stats['duration_total'] += duration
+                stats['duration_max'] = max(stats['duration_max'], duration)
+                stats['lateness_total'] += lateness
+                stats['lateness_max'] = max(stats['lateness_max'], lateness)
+
+    def backlog(self):
+        """
+        :return: {lane: jobs waiting for a worker}
+        """
+        with self._lock:
+            return dict(self.queued)
+
+    def log_stats(self):
+        logger.info(f'Job backlog: {self.backlog()}')
+        for name, stats in sorted(self.stats.items()):
+            runs = max(stats['runs'], 1)
+            logger.info(f'Job {name} ({stats["lane"]}): {stats["runs"]} runs, {stats["failures"]} failed, '
+                        f'{stats["skipped"]} skipped, duration avg {stats["duration_total"] / runs:.2f}s '
+                        f'max {stats["duration_max"]:.2f}s, late avg {stats["lateness_total"] / runs:.2f}s '
+                        f'max {stats["lateness_max"]:.2f}s')
@@ -0,0 +1,81 @@
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+import time
+
+number_pattern = re.compile(r'-?\d+(\.\d+)?')
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Rate limits repetitive debug messages, e.g. the ones the opponent search logs on every iteration.
+
+    Messages that only differ in numbers count as the same message. Each one passes `burst` times
+    per `window` seconds, the rest are dropped and the first message after the window says how
+    many were dropped. Records above DEBUG always pass.
+    """
+
+    def __init__(self, window=60, burst=5):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.suppressed_total = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+
+        key = number_pattern.sub('#', str(record.msg))
+        now = time.time()
+        with self._lock:
+            started, passed, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                if suppressed:
+                    record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+                started, passed, suppressed = now, 0, 0
+            if passed >= self.burst:
+                self._windows[key] = (started, passed, suppressed + 1)
+                self.suppressed_total += 1
+                return False
+            self._windows[key] = (started, passed + 1, suppressed)
+            if len(self._windows) > 1000:
+                self._windows = {key: value for key, value in self._windows.items()
+                                 if now - value[0] < self.window}
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records when the queue is full instead of blocking or raising.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_queue_logging(logger, handlers, max_queue=10000, filters=()):
+    """
+    Route the logger through a queue so formatting and I/O happen on a background listener thread.
+
+    :return: the started QueueListener, stop it on shutdown to flush what is left
+    """
+    log_queue = queue.Queue(max_queue)
+    queue_handler = DroppingQueueHandler(log_queue)
+    for log_filter in filters:
+        queue_handler.addFilter(log_filter)
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
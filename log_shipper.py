@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger('my_application')
+
+# Telegram rejects messages longer than this
+telegram_message_limit = 4096
+
+
+class LogShipper:
+    """
+    Ships new lines of a log file in size-bounded messages without ever touching the file.
+
+    Keeps the file open and remembers the byte offset it got to, so each ship() only reads what
+    was written since the last one. When the file is rotated or truncated the rest of the old file
+    is shipped first and reading continues from the start of the new one. If a send fails the
+    offset stays before the failed message and it is retried on the next ship(). The offset is
+    saved next to the log, so a restart does not ship the same lines again; without a saved offset
+    shipping starts at the end of the file instead of sending its whole history.
+
+    :param send: callable(text) -> True when the message was delivered
+    :param max_chars: message size limit, a line that doesn't fit goes to the next message whole,
+        only lines longer than this are split
+    :param max_messages: messages per ship() call, the rest waits for the next call
+    """
+
+    def __init__(self, path, send, max_chars=telegram_message_limit, max_messages=20, cursor_path=None):
+        self.path = path
+        self.send = send
+        self.max_chars = max_chars
+        self.max_messages = max_messages
+        self.cursor_path = cursor_path or f'{path}.offset'
+        self.file = None
+        self.inode = None
+        self.shipped_bytes = 0
+        self.shipped_messages = 0
+
+    def _open(self, resume=False):
+        try:
+            self.file = open(self.path, 'rb')
+        except FileNotFoundError:
+            self.file = None
+            return False
+        stat = os.fstat(self.file.fileno())
+        self.inode = stat.st_ino
+        if resume:
+            cursor = self._load_cursor()
+            if cursor is None:
+                self.file.seek(0, os.SEEK_END)
+            elif cursor['inode'] == self.inode and cursor['offset'] <= stat.st_size:
+                self.file.seek(cursor['offset'])
+        return True
+
+    def _load_cursor(self):
+        try:
+            with open(self.cursor_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cursor(self):
+        try:
+            with open(self.cursor_path, 'w') as f:
+                json.dump({'inode': self.inode, 'offset': self.file.tell()}, f)
+        except OSError as e:
+            logger.debug(f'Failed to save log shipping offset: {e}')
+
+    def _rotated(self):
+        """
+        True when the path now points to a new file or the current one got shorter than the offset.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self.inode or stat.st_size < self.file.tell()
+
+    def _read_line(self, limit):
+        """
+        Read a complete line of at most limit bytes, a longer line is cut at a character boundary.
+
+        :return: decoded text or None when there is no complete line yet
+        """
+        position = self.file.tell()
+        line = self.file.readline(limit)
+        if not line:
+            return None
+        if not line.endswith(b'\n'):
+            if len(line) < limit:
+                # The writer is still in the middle of this line
+                self.file.seek(position)
+                return None
+            # Don't split a multi-byte character, find where the last one starts and check it is complete
+            for back in range(1, min(4, len(line)) + 1):
+                byte = line[-back]
+                if byte & 0xC0 == 0x80:
+                    continue
+                needed = 1 if byte < 0xC0 else 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+                if needed > back:
+                    self.file.seek(position + len(line) - back)
+                    line = line[:-back]
+                break
+            if not line:
+                # Not even one character fits in what is left of the message
+                return None
+        return line.decode('utf-8', errors='replace')
+
+    def _next_message(self):
+        """
+        :return: (text, offset before reading) or (None, offset) when there is nothing new
+        """
+        start = self.file.tell()
+        parts = []
+        size = 0
+        while size < self.max_chars:
+            position = self.file.tell()
+            # UTF-8 never has fewer bytes than characters, so a byte limit keeps the text under max_chars
+            line = self._read_line(self.max_chars)
+            if line is None:
+                break
+            line_size = len(line.encode('utf-8'))
+            if parts and size + line_size > self.max_chars:
+                # Starts the next message instead of being split across two
+                self.file.seek(position)
+                break
+            parts.append(line)
+            size += line_size
+        if not parts:
+            return None, start
+        return ''.join(parts).rstrip('\n'), start
+
+    def _ship_file(self):
+        """
+        :return: (messages sent, True when the file has been read to the end)
+        """
+        sent = 0
+        while sent < self.max_messages:
+            text, start = self._next_message()
+            if text is None:
+                return sent, True
+            if not text.strip():
+                self._save_cursor()
+                continue
+            if not self.send(text):
+                self.file.seek(start)
+                return sent, False
+            sent += 1
+            self.shipped_bytes += self.file.tell() - start
+            self.shipped_messages += 1
+            self._save_cursor()
+        return sent, False
+
+    def ship(self):
+        """
+        Send everything written since the last call.
+
+        :return: number of messages sent
+        """
+        if self.file is None and not self._open(resume=True):
+            return 0
+
+        sent = 0
+        if self._rotated():
+            # Finish the old file, then switch to the new one
+            sent, finished = self._ship_file()
+            if not finished:
+                return sent
+            self.file.close()
+            if not self._open():
+                return sent
+
+        more, _ = self._ship_file()
+        return sent + more
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
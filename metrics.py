@@ -0,0 +1,252 @@
+import bisect
+import http.server
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.label_names)
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+        return child
+
+    def _default(self):
+        return self.labels() if not self.label_names else None
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines += child.render(self.name, self.label_names, values)
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, label_names, values):
+        return [f'{name}{format_labels(label_names, values)} {format_value(self.value)}']
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, label_names, values):
+        lines = []
+        cumulative = 0
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{format_labels(label_names, values, [("le", format_value(bound))])} '
+                         f'{cumulative}')
+        lines.append(f'{name}_sum{format_labels(label_names, values)} {format_value(total)}')
+        lines.append(f'{name}_count{format_labels(label_names, values)} {count}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=default_buckets):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start_time)
+
+
+class Registry:
+    """
+    Holds the metrics and renders them in the Prometheus text format.
+
+    Collectors are called before every render, use them to copy values that live elsewhere
+    (executor stats, command stats) into gauges.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=default_buckets):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.debug(f'Metrics collector {collector.__name__} failed: {e}')
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Write the metrics to path, replacing the file atomically.
+        """
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serve the metrics on http://host:port/metrics from a daemon thread.
+        """
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info(f'Serving metrics on http://{host}:{port}/metrics')
+        return server
+
+
+class RateWindow:
+    """
+    Number of events in a sliding time window, e.g. duels in the last hour.
+    """
+
+    def __init__(self, window=3600):
+        self.window = window
+        self.times = []
+        self._lock = threading.Lock()
+
+    def add(self, timestamp=None):
+        with self._lock:
+            self.times.append(timestamp or time.time())
+
+    def count(self):
+        since = time.time() - self.window
+        with self._lock:
+            self.times = self.times[bisect.bisect_left(self.times, since):]
+            return len(self.times)
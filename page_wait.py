@@ -0,0 +1,164 @@
+import time
+
+from selenium.common.exceptions import JavascriptException, ScriptTimeoutException, TimeoutException
+from selenium.webdriver.common.by import By
+
+# Resolves as soon as the condition holds (and kept holding for settle ms), checked after DOM
+# mutations plus a slow interval for changes observers can't see, e.g. layout from CSS animations.
+wait_script = """
+var locatorType = arguments[0];
+var locator = arguments[1];
+var condition = arguments[2];
+var settle = arguments[3];
+var timeout = arguments[4];
+var done = arguments[arguments.length - 1];
+var finished = false;
+var since = null;
+var observer = null;
+var interval = null;
+var timer = null;
+
+function find() {
+    if (locatorType === 'xpath') {
+        return document.evaluate(locator, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    }
+    return document.querySelector(locator);
+}
+
+function visible(element) {
+    return !!element && !!(element.offsetWidth || element.offsetHeight || element.getClientRects().length) &&
+        getComputedStyle(element).visibility !== 'hidden';
+}
+
+function satisfied(element) {
+    if (condition === 'gone') {
+        return !visible(element);
+    }
+    if (condition === 'present') {
+        return element !== null;
+    }
+    if (condition === 'visible') {
+        return visible(element);
+    }
+    return visible(element) && !element.disabled && element.getAttribute('aria-disabled') !== 'true';
+}
+
+function finish(result) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer) {
+        observer.disconnect();
+    }
+    clearInterval(interval);
+    clearTimeout(timer);
+    done(result);
+}
+
+function check() {
+    var element = find();
+    if (!satisfied(element)) {
+        since = null;
+        return;
+    }
+    var now = Date.now();
+    since = since === null ? now : since;
+    if (now - since >= settle) {
+        finish(condition === 'gone' ? true : element);
+    }
+}
+
+timer = setTimeout(function () { finish(null); }, timeout);
+interval = setInterval(check, settle > 0 ? Math.min(settle, 200) : 200);
+var scheduled = false;
+if (document.documentElement) {
+    // Busy pages mutate constantly, check at most once per frame
+    observer = new MutationObserver(function () {
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(function () {
+                scheduled = false;
+                if (!finished) {
+                    check();
+                }
+            }, 16);
+        }
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true,
+        characterData: true});
+}
+check();
+"""
+
+
+def to_page_locator(locator):
+    by, value = locator
+    if by == By.XPATH:
+        return 'xpath', value
+    if by == By.CLASS_NAME:
+        return 'css', f'.{value}'
+    if by == By.ID:
+        return 'css', f'#{value}'
+    if by == By.CSS_SELECTOR:
+        return 'css', value
+    raise ValueError(f'Unsupported locator {by}')
+
+
+class InPageWait:
+    """
+    Waits for an element condition inside the page instead of polling it over WebDriver.
+
+    The script resolves on the DOM mutation that satisfies the condition, so a transition is seen
+    within milliseconds. Long waits are split into calls of about `chunk` seconds, chromedriver runs
+    one command per session at a time, so short calls let other WebDriver calls (e.g. the UI
+    watcher's drain) in between. A wait that times out early or gets interrupted by a navigation is
+    picked up again until the timeout.
+    Raises TimeoutException like WebDriverWait.until, other script errors are raised right away.
+    """
+
+    def __init__(self, driver, timeout, chunk=1):
+        self.driver = driver
+        self.timeout = timeout
+        self.chunk = chunk
+
+    def until(self, condition, locator, timeout=None, settle=0):
+        """
+        :param condition: 'present', 'visible', 'clickable' (visible and enabled) or 'gone' (missing or hidden)
+        :param settle: seconds the condition has to keep holding, for UI that is still animating in
+        :return: the element, or True for 'gone'
+        """
+        locator_type, value = to_page_locator(locator)
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutException(f'{value} not {condition} after {timeout}s')
+            # settle has to fit into one call
+            wait_time = min(remaining, self.chunk + settle)
+            try:
+                result = self.driver.execute_async_script(wait_script, locator_type, value, condition,
+                                                          int(settle * 1000), int(wait_time * 1000))
+            except (ScriptTimeoutException, JavascriptException) as e:
+                # A navigation unloads the document under the script, try again on the new one
+                if isinstance(e, JavascriptException) and 'unloaded' not in str(e.msg):
+                    raise
+                if time.time() >= deadline:
+                    raise TimeoutException(f'{value} not {condition} after {timeout}s') from e
+                time.sleep(0.1)
+                continue
+            if result is not None:
+                return result
+
+    def present(self, locator, timeout=None, settle=0):
+        return self.until('present', locator, timeout, settle)
+
+    def visible(self, locator, timeout=None, settle=0):
+        return self.until('visible', locator, timeout, settle)
+
+    def clickable(self, locator, timeout=None, settle=0):
+        return self.until('clickable', locator, timeout, settle)
+
+    def gone(self, locator, timeout=None, settle=0):
+        return self.until('gone', locator, timeout, settle)
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger('my_application')
+
+
+class RecoveryStep:
+    """
+    :param action: callable(driver, reason) doing the fix
+    :param settle: seconds the check has to keep passing after the action, it gets as long again
+        to start passing before the ladder escalates
+    """
+
+    def __init__(self, name, action, settle=2):
+        self.name = name
+        self.action = action
+        self.settle = settle
+
+
+class RecoveryLadder:
+    """
+    Tries recovery steps from the cheapest to the most expensive until the page checks out.
+
+    The check runs once before the first step, so a problem that went away on its own costs nothing.
+    After each step the check is repeated and has to pass for the step's whole settle time, a fix
+    that only hides the problem for a moment escalates to the next step. Checks may act on the
+    page (e.g. take a step to see the character move). Time-to-recover is recorded per step that
+    fixed the problem.
+
+    :param steps: RecoveryStep list, cheapest first, the last one should always work (a full reload)
+    :param checks: {reason: callable(driver) -> True when recovered}, `default_check` for other reasons
+    :param on_recovered: callable(reason, step name or None, seconds) called after every run
+    """
+
+    def __init__(self, steps, checks, default_check, on_recovered=None, check_interval=0.5):
+        self.steps = steps
+        self.checks = checks
+        self.default_check = default_check
+        self.on_recovered = on_recovered
+        self.check_interval = check_interval
+        self.stats = {step.name: {'attempts': 0, 'fixed': 0, 'failed': 0, 'time_total': 0, 'time_max': 0}
+                      for step in steps}
+        self.unrecovered = 0
+        self._lock = threading.Lock()
+
+    def _check(self, driver, check, settle):
+        """
+        True once check has passed continuously for settle seconds, False when that doesn't happen
+        within twice the settle time. With settle 0 a single pass is enough.
+        """
+        deadline = time.time() + 2 * settle
+        since = None
+        while True:
+            try:
+                passed = check(driver)
+            except Exception as e:
+                logger.debug(f'Recovery check failed: {e}')
+                passed = False
+            now = time.time()
+            if not passed:
+                since = None
+            else:
+                since = now if since is None else since
+                if now - since >= settle:
+                    return True
+            if now >= deadline:
+                return False
+            time.sleep(self.check_interval)
+
+    def recover(self, driver, reason, first_step=None):
+        """
+        Run the ladder for reason, starting at first_step when the cheap steps are known not to help.
+
+        :return: name of the step that fixed the page, None when it was fine already or nothing helped
+        """
+        check = self.checks.get(reason, self.default_check)
+        started = time.time()
+        names = [step.name for step in self.steps]
+        steps = self.steps[names.index(first_step):] if first_step else self.steps
+
+        if first_step is None and self._check(driver, check, 0):
+            logger.debug(f'Recovery for {reason}: page is fine already')
+            self._report(reason, None, started)
+            return None
+
+        for step in steps:
+            step_started = time.time()
+            logger.debug(f'Recovery for {reason}: trying {step.name}')
+            try:
+                step.action(driver, reason)
+                fixed = self._check(driver, check, step.settle)
+            except Exception as e:
+                logger.debug(f'Recovery step {step.name} failed: {e}')
+                fixed = False
+
+            duration = time.time() - step_started
+            with self._lock:
+                stats = self.stats[step.name]
+                stats['attempts'] += 1
+                stats['failed'] += not fixed
+                if fixed:
+                    stats['fixed'] += 1
+                    stats['time_total'] += time.time() - started
+                    stats['time_max'] = max(stats['time_max'], time.time() - started)
+            if fixed:
+                logger.info(f'Recovered from {reason} with {step.name} in {time.time() - started:.1f}s '
+                            f'({duration:.1f}s for the step)')
+                self._report(reason, step.name, started)
+                return step.name
+
+        with self._lock:
+            self.unrecovered += 1
+        logger.error(f'Recovery for {reason} failed after {time.time() - started:.1f}s')
+        self._report(reason, 'failed', started)
+        return None
+
+    def _report(self, reason, step, started):
+        if self.on_recovered is not None:
+            self.on_recovered(reason, step, time.time() - started)
+
+    def log_stats(self):
+        for name, stats in self.stats.items():
+            fixed = max(stats['fixed'], 1)
+            logger.info(f'Recovery step {name}: {stats["attempts"]} attempts, fixed {stats["fixed"]}, '
+                        f'time to recover avg {stats["time_total"] / fixed:.1f}s max {stats["time_max"]:.1f}s')
+        logger.info(f'Recoveries that failed every step: {self.unrecovered}')
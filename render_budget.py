@@ -0,0 +1,110 @@
+import json
+
+# Wraps requestAnimationFrame so the game's animation loop runs at most `fps` frames a second.
+# Callbacks are batched into one native frame, between frames the page sleeps on a timer instead of
+# waking up on every vsync. Calling it again changes the cap or starts a boost, e.g. while a frame
+# is captured, the wrapper itself is only installed once per document.
+render_budget_script = """
+(function (options) {
+    var budget = window.__botRender;
+    if (!budget) {
+        budget = window.__botRender = {fps: 0, boostFps: 0, boostUntil: 0, frames: 0};
+        var nativeRequest = window.requestAnimationFrame.bind(window);
+        var callbacks = new Map();
+        var nextId = 1;
+        var scheduled = false;
+        var timer = null;
+        var lastFrame = 0;
+
+        // 0 is no cap, a boost only ever raises the cap
+        function currentFps() {
+            if (performance.now() >= budget.boostUntil || budget.fps === 0) {
+                return budget.fps;
+            }
+            return budget.boostFps === 0 ? 0 : Math.max(budget.fps, budget.boostFps);
+        }
+
+        function runFrame(timestamp) {
+            scheduled = false;
+            lastFrame = timestamp;
+            budget.frames++;
+            var pending = callbacks;
+            callbacks = new Map();
+            pending.forEach(function (callback) {
+                try {
+                    callback(timestamp);
+                } catch (e) {
+                    setTimeout(function () { throw e; });
+                }
+            });
+        }
+
+        function schedule() {
+            scheduled = true;
+            var fps = currentFps();
+            var delay = fps > 0 ? lastFrame + 1000 / fps - performance.now() : 0;
+            if (delay > 4) {
+                timer = setTimeout(function () {
+                    timer = null;
+                    nativeRequest(runFrame);
+                }, delay);
+            } else {
+                nativeRequest(runFrame);
+            }
+        }
+
+        budget.reschedule = function () {
+            if (timer !== null) {
+                clearTimeout(timer);
+                timer = null;
+                schedule();
+            }
+        };
+
+        window.requestAnimationFrame = function (callback) {
+            var id = nextId++;
+            callbacks.set(id, callback);
+            if (!scheduled) {
+                schedule();
+            }
+            return id;
+        };
+        window.cancelAnimationFrame = function (id) {
+            callbacks.delete(id);
+        };
+    }
+
+    if (options.fps !== undefined) {
+        budget.fps = options.fps;
+    }
+    if (options.boostMs) {
+        budget.boostFps = options.boostFps;
+        budget.boostUntil = performance.now() + options.boostMs;
+    }
+    // A frame that is waiting out a low cap is due sooner now
+    budget.reschedule();
+    return {fps: budget.fps, frames: budget.frames};
+})(%s)
+"""
+
+
+def render_budget_expression(**options):
+    return render_budget_script % json.dumps(options)
+
+
+def install_render_budget(driver, fps):
+    """
+    Cap the game's animation loop to fps frames a second, 0 for no cap. Safe to call repeatedly,
+    a reload removes the cap so it has to be installed again.
+
+    :return: {'fps': current cap, 'frames': frames rendered since the cap was installed}
+    """
+    return driver.execute_script('return ' + render_budget_expression(fps=fps))
+
+
+def boost_render_budget(driver, fps, seconds):
+    """
+    Raise the cap to fps for the next seconds, e.g. so a capture gets a fresh frame. A boost below
+    the current cap changes nothing.
+    """
+    return driver.execute_script('return ' + render_budget_expression(boostFps=fps, boostMs=int(seconds * 1000)))
@@ -0,0 +1,138 @@
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from log_shipper import telegram_message_limit
+
+logger = logging.getLogger('my_application')
+
+default_topic = object()
+
+
+class TelegramNotifier:
+    """
+    Sends Telegram messages from a background thread so callers never wait on the API.
+
+    Messages go into a bounded queue, when it is full the oldest message is dropped. Messages
+    that arrive within `coalesce_window` seconds of each other for the same topic are joined into
+    one sendMessage as long as they fit into the message limit. A 429 response is retried after
+    the `retry_after` Telegram asks for, other failures with backoff. Both count against `attempts`
+    and no more than `max_retry_wait` seconds are spent waiting on rate limits per message.
+
+    :param api_base: Telegram Bot API url, point it to a local server to test without Telegram
+    """
+
+    def __init__(self, token, chat_id, topic_id=None, api_base='https://api.telegram.org', max_queue=200,
+                 coalesce_window=1.0, timeout=(5, 15), attempts=3, max_retry_wait=60):
+        self.url = f'{api_base.rstrip("/")}/bot{token}/sendMessage'
+        self.chat_id = chat_id
+        self.topic_id = topic_id
+        self.max_queue = max_queue
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.attempts = attempts
+        self.max_retry_wait = max_retry_wait
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self, text, topic_id=default_topic):
+        """
+        Queue a message, returns a Future that resolves to True once it is delivered.
+        """
+        future = concurrent.futures.Future()
+        topic_id = self.topic_id if topic_id is default_topic else topic_id
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                _, _, dropped_future = self._queue.popleft()
+                dropped_future.set_result(False)
+                self.dropped += 1
+            self._queue.append((topic_id, text, future))
+            self._condition.notify()
+        return future
+
+    def _next_batch(self):
+        """
+        Wait for a message, then collect the ones that follow it within the coalesce window.
+        """
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            topic_id, text, future = self._queue.popleft()
+            texts, futures = [text], [future]
+            size = len(text)
+            deadline = time.time() + self.coalesce_window
+            while True:
+                if self._queue:
+                    next_topic_id, next_text, next_future = self._queue[0]
+                    if next_topic_id != topic_id or size + len(next_text) + 1 > telegram_message_limit:
+                        break
+                    self._queue.popleft()
+                    texts.append(next_text)
+                    futures.append(next_future)
+                    size += len(next_text) + 1
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+        return topic_id, '\n'.join(texts), futures
+
+    def _post(self, topic_id, text):
+        data = {'chat_id': self.chat_id, 'text': text[:telegram_message_limit]}
+        if topic_id:
+            data['message_thread_id'] = topic_id
+
+        attempt = 0
+        retry_wait = 0
+        while attempt < self.attempts:
+            try:
+                response = self.session.post(self.url, data=data, timeout=self.timeout)
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                    attempt += 1
+                    retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+                    if attempt >= self.attempts or retry_wait + retry_after > self.max_retry_wait:
+                        print(f'Telegram rate limit still hit, dropping the message after {retry_wait}s')
+                        return False
+                    logger.debug(f'Telegram rate limit hit, retrying in {retry_after}s')
+                    retry_wait += retry_after
+                    time.sleep(retry_after)
+                    continue
+                if response.ok:
+                    return True
+                print(f'Telegram sendMessage failed: {response.status_code} {response.text[:200]}')
+            except Exception as e:
+                print(f'Telegram sendMessage failed: {e}')
+            attempt += 1
+            if attempt < self.attempts:
+                time.sleep(2 ** attempt)
+        return False
+
+    def _run(self):
+        while True:
+            topic_id, text, futures = self._next_batch()
+            delivered = self._post(topic_id, text)
+            if delivered:
+                self.sent += 1
+            else:
+                self.failed += 1
+            for future in futures:
+                future.set_result(delivered)
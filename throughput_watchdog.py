@@ -0,0 +1,217 @@
+import contextlib
+import logging
+import threading
+import time
+
+from metrics import RateWindow
+
+logger = logging.getLogger('my_application')
+
+
+class ThroughputWatchdog:
+    """
+    Compares the bot's throughput with its own baseline and reacts as soon as it falls off.
+
+    Tracks duels over a short rolling window, search iterations per minute, the time since the
+    detector last found somebody and heartbeats of the worker loops. Baselines are moving averages
+    that only learn while everything looks healthy, a rate under `drop_ratio` of its baseline is a
+    problem. A detector drought only counts once the learned hit rate says at least
+    `min_expected_hits` hits should have happened in `max_hit_age`, so an empty server isn't one.
+    Throughput problems go to on_stall(reason) (e.g. to run the recovery ladder), stale heartbeats
+    to on_alert(message) since a dead loop can't be fixed from the page. A loop blocked in a long
+    task inside busy() is not stale, unless it stays there for `busy_timeout`.
+
+    Rates only mean something while the search can run. Inside paused() (e.g. a duel holding the
+    page) or while is_paused() is true (e.g. the page gate is closed) no rate is checked and no
+    baseline learns, and the search rate and detector drought count from the end of the pause.
+
+    :param is_paused: callable() -> True while the rates are meaningless, checked every check_interval
+    """
+
+    def __init__(self, on_stall, on_alert, duel_window=600, drop_ratio=0.4, warmup=1200, min_expected_duels=3,
+                 max_hit_age=300, min_expected_hits=3, heartbeat_timeout=180, busy_timeout=900, cooldown=600,
+                 check_interval=15, smoothing=0.05, is_paused=None):
+        self.on_stall = on_stall
+        self.on_alert = on_alert
+        self.duel_window = duel_window
+        self.drop_ratio = drop_ratio
+        self.warmup = warmup
+        self.min_expected_duels = min_expected_duels
+        self.max_hit_age = max_hit_age
+        self.min_expected_hits = min_expected_hits
+        self.heartbeat_timeout = heartbeat_timeout
+        self.busy_timeout = busy_timeout
+        self.cooldown = cooldown
+        self.check_interval = check_interval
+        self.smoothing = smoothing
+        self.is_paused = is_paused
+        self.started = time.time()
+        self.duels = RateWindow(duel_window)
+        self.duels_hour = RateWindow(3600)
+        self.iterations = RateWindow(60)
+        self.successful_iterations = RateWindow(60)
+        self.last_hit = time.time()
+        self.hits = RateWindow(3600)
+        self.heartbeats = {}
+        self.busy_since = {}
+        self.pauses = {}
+        self.last_paused = 0
+        self.heartbeat_sources = {}
+        self.baseline_duels_per_hour = None
+        self.baseline_iterations_per_minute = None
+        self.baseline_hits_per_hour = None
+        self.last_triggered = {}
+        self.triggered = {}
+
+    def record_duel(self):
+        self.duels.add()
+        self.duels_hour.add()
+
+    def record_iteration(self, success):
+        self.iterations.add()
+        if success:
+            self.successful_iterations.add()
+
+    def record_detector_hit(self):
+        self.last_hit = time.time()
+        self.hits.add()
+
+    def heartbeat(self, name):
+        self.heartbeats[name] = time.time()
+
+    @contextlib.contextmanager
+    def busy(self, name):
+        """
+        The loop name is blocked in a long task, e.g. waiting for a duel on the executor.
+        """
+        self.busy_since[name] = time.time()
+        try:
+            yield
+        finally:
+            self.busy_since.pop(name, None)
+            self.heartbeat(name)
+
+    @contextlib.contextmanager
+    def paused(self, name):
+        """
+        Throughput is expected to drop while the block runs, e.g. a duel keeps the search off the page.
+        """
+        self.pauses[name] = self.pauses.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            self.pauses[name] -= 1
+            if not self.pauses[name]:
+                del self.pauses[name]
+            self.last_paused = time.time()
+
+    def _paused(self):
+        if self.pauses:
+            return True
+        try:
+            return bool(self.is_paused and self.is_paused())
+        except Exception:
+            return False
+
+    def watch(self, name, last_beat):
+        """
+        Take the heartbeat of name from last_beat(), e.g. the UI watcher's last drain time.
+        """
+        self.heartbeat_sources[name] = last_beat
+
+    def _update_baseline(self, baseline, value):
+        if baseline is None:
+            return value
+        return baseline + self.smoothing * (value - baseline)
+
+    def _trigger(self, reason, message, stall=True):
+        now = time.time()
+        if now - self.last_triggered.get(reason, 0) < self.cooldown:
+            return
+        self.last_triggered[reason] = now
+        self.triggered[reason] = self.triggered.get(reason, 0) + 1
+        logger.info(f'Watchdog: {message}')
+        try:
+            if stall:
+                self.on_stall(reason)
+            else:
+                self.on_alert(message)
+        except Exception as e:
+            logger.error(f'Watchdog handler for {reason} failed: {e}')
+
+    def check(self):
+        now = time.time()
+        duels_per_hour = self.duels.count() * 3600 / self.duel_window
+        iterations_per_minute = self.successful_iterations.count()
+        warmed_up = now - self.started >= self.warmup
+        paused = self._paused()
+        if paused:
+            self.last_paused = now
+        # The last minute of iterations only counts once all of it was free of pauses
+        search_free = not paused and now - self.last_paused >= self.iterations.window
+        hit_age = now - max(self.last_hit, self.last_paused)
+        problems = False
+
+        if warmed_up and not paused and self.baseline_duels_per_hour:
+            expected = self.baseline_duels_per_hour * self.duel_window / 3600
+            if expected >= self.min_expected_duels and duels_per_hour < self.baseline_duels_per_hour * self.drop_ratio:
+                problems = True
+                self._trigger('duel_rate', f'{duels_per_hour:.0f} duels/hour against a baseline of '
+                                           f'{self.baseline_duels_per_hour:.0f}')
+
+        if warmed_up and search_free and self.baseline_iterations_per_minute:
+            if iterations_per_minute < self.baseline_iterations_per_minute * self.drop_ratio:
+                problems = True
+                self._trigger('search_rate', f'{iterations_per_minute} successful search iterations/minute against '
+                                             f'a baseline of {self.baseline_iterations_per_minute:.0f}')
+
+        if warmed_up and not paused and self.baseline_hits_per_hour and hit_age > self.max_hit_age:
+            expected = self.baseline_hits_per_hour * self.max_hit_age / 3600
+            if expected >= self.min_expected_hits:
+                problems = True
+                self._trigger('no_detector_hit', f'detector found nobody for {hit_age:.0f}s, '
+                                                 f'expected {expected:.0f} hits')
+
+        beats = dict(self.heartbeats)
+        for name, last_beat in self.heartbeat_sources.items():
+            try:
+                beats[name] = last_beat()
+            except Exception:
+                pass
+        for name, last_beat in beats.items():
+            busy_since = self.busy_since.get(name)
+            if busy_since is not None and now - busy_since < self.busy_timeout:
+                continue
+            if now - last_beat > self.heartbeat_timeout:
+                problems = True
+                self._trigger(f'heartbeat_{name}', f'{name} has not reported for {now - last_beat:.0f}s',
+                              stall=False)
+
+        if not problems and not paused:
+            self.baseline_duels_per_hour = self._update_baseline(self.baseline_duels_per_hour, duels_per_hour)
+            if search_free:
+                self.baseline_iterations_per_minute = self._update_baseline(self.baseline_iterations_per_minute,
+                                                                            iterations_per_minute)
+            # The last hour is only a rate once a whole hour has been seen
+            if now - self.started >= 3600:
+                self.baseline_hits_per_hour = self._update_baseline(self.baseline_hits_per_hour, self.hits.count())
+
+    def run(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f'Watchdog check failed: {e}')
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def log_stats(self):
+        logger.info(f'Watchdog: {self.duels_hour.count()} duels in the last hour, '
+                    f'{self.successful_iterations.count()} successful search iterations in the last minute, '
+                    f'last detector hit {time.time() - self.last_hit:.0f}s ago, '
+                    f'baselines {self.baseline_duels_per_hour or 0:.0f} duels/hour '
+                    f'{self.baseline_iterations_per_minute or 0:.0f} iterations/minute '
+                    f'{self.baseline_hits_per_hour or 0:.0f} detector hits/hour, triggered {self.triggered}')
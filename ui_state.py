@@ -0,0 +1,101 @@
+from typing import NamedTuple, Optional
+
+from interface_cleanup import chat_discarded_expression, outside_hidden, suppressed_nodes_expression
+
+bug_texts = [
+    'walk with a duel request screen open, please click the decline button or refresh the game.',
+    'You are already in a duel request screen with someone else.'
+]
+
+# Elements that only have to be present on the page, outside of what the cleanup hides
+present_xpaths = {name: outside_hidden(xpath) for name, xpath in {
+    'leaderboard': "//span[contains(text(), 'Leaderboard')]",
+    'matchmaking_lobby': "//span[contains(text(), 'Matchmaking Lobby')]",
+    'back_to_character': "//button[contains(text(), 'Back To Character')]",
+    'something_went_wrong': "//span[contains(text(), 'Something went wrong')]",
+    'duel_history': "//span[contains(text(), 'Duel History')]",
+    'duel_reward': "//span[contains(text(), 'Duel Reward')]",
+    'blast_orb': "//span[contains(text(), 'Blast Orb')]",
+}.items()}
+
+# Elements that have to be displayed, same as WebElement.is_displayed()
+visible_xpaths = {
+    'recaptcha_failed': "//p[contains(text(), 'Recaptcha verification failed')]",
+    'server_disconnect': "//p[contains(text(), 'Server Disconnect')]",
+    'captcha_required': "//p[contains(text(), 'Are you a robot? Please complete the captcha to continue')]",
+}
+
+ui_state_script = """
+var presentXpaths = arguments[0];
+var visibleXpaths = arguments[1];
+var bugTexts = arguments[2];
+
+function find(xpath) {
+    return document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+
+function visible(element) {
+    return !!element && !!(element.offsetWidth || element.offsetHeight || element.getClientRects().length) &&
+        getComputedStyle(element).visibility !== 'hidden';
+}
+
+function coordinate(prefix) {
+    var element = find("//span[contains(text(), '" + prefix + "')]");
+    return element ? parseInt(element.textContent.slice(3)) : null;
+}
+
+var state = {};
+for (var name in presentXpaths) {
+    state[name] = find(presentXpaths[name]) !== null;
+}
+for (var name in visibleXpaths) {
+    state[name] = visible(find(visibleXpaths[name]));
+}
+state.bug_text = null;
+for (var i = 0; i < bugTexts.length; i++) {
+    if (visible(find("//span[contains(text(), '" + bugTexts[i] + "')]"))) {
+        state.bug_text = bugTexts[i];
+        break;
+    }
+}
+var chat = find("//button[contains(text(), 'General')]");
+state.chat_present = chat !== null;
+state.chat_displayed = visible(chat);
+state.x = coordinate('X:');
+state.y = coordinate('Y:');
+state.suppressed_nodes = %s;
+state.chat_discarded = %s;
+return state;
+""" % (suppressed_nodes_expression, chat_discarded_expression)
+
+
+class UIState(NamedTuple):
+    leaderboard: bool
+    matchmaking_lobby: bool
+    back_to_character: bool
+    something_went_wrong: bool
+    duel_history: bool
+    duel_reward: bool
+    blast_orb: bool
+    recaptcha_failed: bool
+    server_disconnect: bool
+    captcha_required: bool
+    bug_text: Optional[str]
+    chat_present: bool
+    chat_displayed: bool
+    x: Optional[int]
+    y: Optional[int]
+    suppressed_nodes: Optional[int]
+    chat_discarded: Optional[int]
+
+    @property
+    def needs_captcha(self):
+        return self.recaptcha_failed or self.server_disconnect or self.captcha_required
+
+
+def get_ui_state(driver):
+    """
+    Read every known popup, bug marker and the map coordinates in one script call.
+    """
+    state = driver.execute_script(ui_state_script, present_xpaths, visible_xpaths, bug_texts)
+    return UIState(**{field: state.get(field) for field in UIState._fields})
@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+
+from selenium.webdriver.common.by import By
+
+from interface_cleanup import outside_hidden
+
+logger = logging.getLogger('my_application')
+
+# The find_elements fallbacks can't check visibility, so leave out what the cleanup hides
+watched_xpaths = {name: outside_hidden(xpath) for name, xpath in {
+    'duel_request': "//span[contains(text(), 'Duel Request')]",
+    'incoming_accept': "//div[contains(@class, 'chat-container')]//button[contains(text(), 'Accept')]",
+    'duel_reward': "//span[contains(text(), 'Duel Reward')]",
+    'server_disconnect': "//p[contains(text(), 'Server Disconnect')]",
+    'recaptcha_failed': "//p[contains(text(), 'Recaptcha verification failed')]",
+    'captcha_required': "//p[contains(text(), 'Are you a robot? Please complete the captcha to continue')]",
+    'bug_walk_with_request': "//span[contains(text(), 'walk with a duel request screen open, please click the decline "
+                             "button or refresh the game.')]",
+    'bug_already_in_request': "//span[contains(text(), 'You are already in a duel request screen with someone "
+                              "else.')]",
+}.items()}
+
+# Installs a MutationObserver that re-checks the watched xpaths at most every 50 ms while the page
+# changes, keeps their current state and queues an event whenever one shows up or the X/Y changes.
+install_script = """
+if (window.__botWatcher) {
+    return true;
+}
+if (!document.body) {
+    return false;
+}
+var xpaths = arguments[0];
+var watcher = {queue: [], state: {}, dropped: 0, scheduled: false};
+
+function find(xpath) {
+    return document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+
+function visible(element) {
+    return !!element && !!(element.offsetWidth || element.offsetHeight || element.getClientRects().length) &&
+        getComputedStyle(element).visibility !== 'hidden';
+}
+
+function coordinate(prefix) {
+    var element = find("//span[contains(text(), '" + prefix + "')]");
+    return element ? parseInt(element.textContent.slice(3)) : null;
+}
+
+function push(event) {
+    // Set up by the asyncio runtime with Runtime.addBinding to get events without polling
+    if (typeof window.__botNotify === 'function') {
+        window.__botNotify(JSON.stringify(event));
+    }
+    watcher.queue.push(event);
+    if (watcher.queue.length > 200) {
+        watcher.queue.shift();
+        watcher.dropped++;
+    }
+}
+
+watcher.check = function () {
+    watcher.scheduled = false;
+    var now = Date.now();
+    for (var name in xpaths) {
+        var active = visible(find(xpaths[name]));
+        if (active && !watcher.state[name]) {
+            push({type: name, time: now});
+        }
+        watcher.state[name] = active;
+    }
+    var x = coordinate('X:');
+    var y = coordinate('Y:');
+    if (x !== watcher.state.x || y !== watcher.state.y) {
+        watcher.state.x = x;
+        watcher.state.y = y;
+        push({type: 'coordinates', time: now, x: x, y: y});
+    }
+};
+
+watcher.observer = new MutationObserver(function () {
+    if (!watcher.scheduled) {
+        watcher.scheduled = true;
+        setTimeout(watcher.check, 50);
+    }
+});
+// Popups are also shown and hidden with style or class changes, not only added and removed
+watcher.observer.observe(document.body, {childList: true, subtree: true, characterData: true, attributes: true,
+    attributeFilter: ['style', 'class']});
+watcher.check();
+window.__botWatcher = watcher;
+return true;
+"""
+
+# Re-checks right away instead of trusting state from the last drain, null when not installed
+check_script = """
+var watcher = window.__botWatcher;
+if (!watcher) {
+    return null;
+}
+watcher.check();
+return !!watcher.state[arguments[0]];
+"""
+
+drain_script = """
+var watcher = window.__botWatcher;
+if (!watcher) {
+    return null;
+}
+var events = watcher.queue;
+watcher.queue = [];
+return {events: events, state: watcher.state, dropped: watcher.dropped};
+"""
+
+
+class UIWatcher:
+    """
+    Watches the game UI from inside the page and drains what happened in one call per tick.
+
+    wait_for() blocks until a watched element is on the page. While the in-page observer is not
+    reachable (e.g. during a reload) it falls back to polling the xpath with find_elements.
+    """
+
+    def __init__(self, driver, interval=0.1, stale_after=3, poller=None):
+        self.driver = driver
+        self.interval = interval
+        self.poller = poller
+        self.stale_after = stale_after
+        self.state = {}
+        self.last_drain = 0
+        self.drains = 0
+        self.events = 0
+        self.dropped = 0
+        self.listeners = []
+        self._active = {name: threading.Event() for name in watched_xpaths}
+        self._thread = None
+
+    @property
+    def healthy(self):
+        return time.time() - self.last_drain < self.stale_after
+
+    def install(self):
+        return self.driver.execute_script(install_script, watched_xpaths)
+
+    def drain(self):
+        result = self.driver.execute_script(drain_script)
+        if result is None:
+            self.install()
+            return []
+
+        self.state = result['state']
+        self.dropped = result['dropped']
+        self.last_drain = time.time()
+        self.drains += 1
+        self.events += len(result['events'])
+        for name, active in self._active.items():
+            if self.state.get(name):
+                active.set()
+            else:
+                active.clear()
+        for event in result['events']:
+            for listener in self.listeners:
+                listener(event)
+        return result['events']
+
+    def run(self):
+        while True:
+            try:
+                events = self.drain()
+                if self.poller is not None:
+                    # Coordinate changes alone are just walking, only UI events keep the fast interval
+                    if any(event['type'] != 'coordinates' for event in events):
+                        self.poller.activity()
+                    else:
+                        self.poller.idle()
+            except Exception as e:
+                logger.debug(f'UI watcher drain failed: {e}')
+            if self.poller is not None:
+                self.poller.sleep()
+            else:
+                time.sleep(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def is_active(self, name):
+        if self.healthy:
+            return self._active[name].is_set()
+        return len(self.driver.find_elements(By.XPATH, watched_xpaths[name])) > 0
+
+    def is_active_now(self, name):
+        """
+        Check name on the page itself, for callers that hold the driver and can't act on a state
+        that is one drain old.
+        """
+        active = self.driver.execute_script(check_script, name)
+        if active is None:
+            return len(self.driver.find_elements(By.XPATH, watched_xpaths[name])) > 0
+        return active
+
+    def wait_for(self, name, timeout):
+        """
+        Wait until the watched element is on the page.
+
+        :return: True if it is there, False on timeout
+        """
+        if self.healthy:
+            return self._active[name].wait(timeout)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.is_active(name):
+                return True
+            time.sleep(self.interval)
+        return False
+
+    def coordinates(self):
+        """
+        :return: (x, y) map position from the last drain, or None if it is unknown or stale
+        """
+        if not self.healthy or self.state.get('x') is None or self.state.get('y') is None:
+            return None
+        return self.state['x'], self.state['y']